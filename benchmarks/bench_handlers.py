@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the emit path of the monitoring handlers.
+
+The OP5 handlers send to a stub transport, so no server is needed.  Run
+with::
+
+    python benchmarks/bench_handlers.py
+"""
+
+import logging
+import os
+import tempfile
+
+import requests
+from requests.adapters import BaseAdapter
+
+from pytroll_monitor.checkmk_logger import RuleSet, Trollflow2CheckMKHandler
+from pytroll_monitor.op5_logger import AsyncOP5Handler, OP5Handler
+from timing import time_per_call
+
+SERVER = "http://op5.invalid/api/command/PROCESS_SERVICE_CHECK_RESULT"
+LEVELS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR)
+RULE_COUNTS = (1, 10, 50)
+
+
+class StubAdapter(BaseAdapter):
+    """A transport answering OK to every request, without any network."""
+
+    def send(self, request, **kwargs):
+        """Answer the request."""
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"OK"
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        """Nothing to close."""
+
+
+def make_record(levelno, msg="Processing granule %d", args=(42, )):
+    """Make a log record."""
+    return logging.makeLogRecord({"name": "pytroll.bench", "levelno": levelno,
+                                  "levelname": logging.getLevelName(levelno),
+                                  "msg": msg, "args": args})
+
+
+def stub_transport(handler):
+    """Make the handler send to the stub transport."""
+    handler.monitor.session.mount("http://", StubAdapter())
+    return handler
+
+
+def bench_op5_emit():
+    """Time OP5Handler.emit of a warning, return seconds per record."""
+    handler = stub_transport(OP5Handler("service", SERVER, "host"))
+    record = make_record(logging.WARNING)
+    try:
+        return time_per_call(lambda: handler.emit(record))
+    finally:
+        handler.close()
+
+
+def bench_async_op5_emit(nrecords=2000):
+    """Time AsyncOP5Handler.emit of warnings until they are sent, return seconds per record."""
+    handler = stub_transport(AsyncOP5Handler("service", SERVER, "host"))
+    record = make_record(logging.WARNING)
+
+    def emit_and_drain():
+        for _ in range(nrecords):
+            handler.emit(record)
+        handler.flush(timeout=60)
+
+    try:
+        return time_per_call(emit_and_drain) / nrecords
+    finally:
+        handler.close()
+
+
+def bench_checkmk_emit(levelno, tmpdir):
+    """Time Trollflow2CheckMKHandler.emit at a level, return seconds per record."""
+    handler = Trollflow2CheckMKHandler(os.path.join(tmpdir, "status"))
+    record = make_record(levelno)
+    try:
+        return time_per_call(lambda: handler.emit(record))
+    finally:
+        handler.close()
+
+
+def bench_rules_match(nrules):
+    """Time RuleSet.match of an info record matching none of `nrules` rules, return seconds per record."""
+    rules = RuleSet([{"max_level": "INFO", "message": "^Product %d was not produced" % i, "status": "WARN"}
+                     for i in range(nrules)])
+    record = make_record(logging.INFO)
+    return time_per_call(lambda: rules.match(record))
+
+
+def run():
+    """Run the benchmarks, return the seconds per record of each."""
+    results = {"OP5Handler.emit": bench_op5_emit(),
+               "AsyncOP5Handler.emit": bench_async_op5_emit()}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for levelno in LEVELS:
+            name = "Trollflow2CheckMKHandler.emit[%s]" % logging.getLevelName(levelno)
+            results[name] = bench_checkmk_emit(levelno, tmpdir)
+    for nrules in RULE_COUNTS:
+        results["RuleSet.match[%d rules]" % nrules] = bench_rules_match(nrules)
+    return results
+
+
+def main():
+    """Run the benchmarks and print the results."""
+    for name, seconds in run().items():
+        print("%-45s %12.1f us" % (name, seconds * 1e6))
+
+
+if __name__ == "__main__":
+    main()
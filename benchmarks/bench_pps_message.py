@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the creation of PPS posttroll messages for datasets of growing size.
+
+Run with::
+
+    python benchmarks/bench_pps_message.py
+"""
+
+from datetime import datetime, timedelta
+
+from pytroll_monitor.pps_posttroll_hook import PPSMessage, is_segment
+from timing import time_per_call
+
+DATASET_SIZES = (1, 100, 10000)
+
+
+def make_pps_message():
+    """Create a PPS message hook the way it is loaded from yaml."""
+    message = PPSMessage.__new__(PPSMessage)
+    message.__setstate__({"station": "norrkoping",
+                          "posttroll_topic": "PPS",
+                          "output_format": "CF",
+                          "level": "2"})
+    return message
+
+
+def make_mda(nfiles):
+    """Create the metadata of a PGE with `nfiles` output files."""
+    start_time = datetime(2026, 10, 18, 12, 0)
+    return {"module": "ppsCmask",
+            "platform_name": "npp",
+            "sensor": "viirs",
+            "orbit_number": 12345,
+            "start_time": start_time,
+            "end_time": start_time + timedelta(seconds=85),
+            "filename": ["/data/pps/export/S_NWC_CMA_npp_12345_%05d.nc" % i for i in range(nfiles)]}
+
+
+def bench_create_message(nfiles):
+    """Time create_message for a dataset of `nfiles` files, return seconds per call."""
+    message = make_pps_message()
+    mda = make_mda(nfiles)
+    return time_per_call(lambda: message.create_message("OK", mda))
+
+
+def bench_is_segment():
+    """Time is_segment on a VIIRS granule, return seconds per call."""
+    mda = make_mda(1)
+    return time_per_call(lambda: is_segment(mda))
+
+
+def run():
+    """Run the benchmarks, return the seconds per call of each."""
+    results = {"PPSMessage.create_message[%d files]" % nfiles: bench_create_message(nfiles)
+               for nfiles in DATASET_SIZES}
+    results["is_segment"] = bench_is_segment()
+    return results
+
+
+def main():
+    """Run the benchmarks and print the results."""
+    for name, seconds in run().items():
+        print("%-45s %12.1f us" % (name, seconds * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load and fault-injection test of the OP5 handlers.
+
+The handler sends to a local stub server, see
+:class:`pytroll_monitor.testing.OP5StubServer`, at a given record rate while
+faults are injected, and the end-to-end latency percentiles, the delivered
+and lost statuses and the peak memory are reported.  Run with, e.g.::
+
+    python benchmarks/load_op5.py --rate 500 --duration 10 --latency .02 --error-rate .05
+"""
+
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+
+from pytroll_monitor import op5_logger
+from pytroll_monitor.testing import OP5StubServer, fail_dns
+
+HANDLERS = ("OP5Handler", "AsyncOP5Handler")
+
+
+def percentile(values, percent):
+    """Get a percentile of sorted values, None if there are none."""
+    if not values:
+        return None
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def run(handler="AsyncOP5Handler", rate=200, duration=5, latency=0, error_rate=0, reset_rate=0,
+        dns_failure_rate=0, seed=0, **handler_kwargs):
+    """Drive a handler at `rate` records a second for `duration` seconds, return the results."""
+    count = int(rate * duration)
+    emitted = []
+    with OP5StubServer(latency=latency, error_rate=error_rate, reset_rate=reset_rate, seed=seed) as server:
+        handler_kwargs.setdefault("failure_threshold", None)
+        monitor = getattr(op5_logger, handler)("service", server.url, "host", **handler_kwargs)
+        monitor.handleError = lambda record: None
+        tracemalloc.start()
+        with fail_dns(server.hostname, dns_failure_rate, seed) as dns:
+            start = time.perf_counter()
+            for number in range(count):
+                delay = start + number / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                emitted.append(time.perf_counter())
+                monitor.handle(logging.makeLogRecord({"levelno": logging.WARNING, "msg": "load %d",
+                                                      "args": (number, )}))
+            emitting = time.perf_counter() - start
+            monitor.close()
+            draining = time.perf_counter() - start - emitting
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stats = monitor.stats()
+        received = list(server.received)
+        injected = {"errors": server.errors, "resets": server.resets, "dns_failures": dns.failures}
+
+    latencies = sorted(received_at - emitted[int(status["plugin_output"].split()[1])]
+                       for received_at, status in received)
+    delivered = len({status["plugin_output"] for _, status in received})
+    return {"handler": handler,
+            "records": count,
+            "emit_rate": count / emitting,
+            "drain_time": draining,
+            "delivered": delivered,
+            "lost": count - delivered,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p90": percentile(latencies, 90),
+            "latency_p99": percentile(latencies, 99),
+            "latency_max": latencies[-1] if latencies else None,
+            "peak_memory": peak_memory,
+            "injected": injected,
+            "stats": stats}
+
+
+def main(args=None):
+    """Run the load test from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--handler", choices=HANDLERS, default="AsyncOP5Handler")
+    parser.add_argument("--rate", type=float, default=200, help="records per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds")
+    parser.add_argument("--latency", type=float, default=0, help="server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of 503 errors")
+    parser.add_argument("--reset-rate", type=float, default=0, help="share of connection resets")
+    parser.add_argument("--dns-failure-rate", type=float, default=0, help="share of failed name resolutions")
+    parser.add_argument("--workers", type=int, help="workers of the async handler")
+    parser.add_argument("--max-queue-size", type=int, help="queue size of the async handler")
+    parser.add_argument("--overflow", choices=op5_logger.OVERFLOW_POLICIES, help="overflow policy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = vars(parser.parse_args(args))
+    handler_kwargs = {key: args.pop(key) for key in ("workers", "max_queue_size", "overflow")}
+    handler_kwargs = {key: value for key, value in handler_kwargs.items() if value is not None}
+    print(json.dumps(run(**args, **handler_kwargs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
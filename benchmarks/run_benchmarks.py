@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Run the pytroll-monitor benchmarks and store or compare the results.
+
+The results are stored as json, so that two runs, for example of two
+releases, can be compared::
+
+    python benchmarks/run_benchmarks.py -o baseline.json
+    python benchmarks/run_benchmarks.py -o new.json --compare baseline.json
+
+When comparing, the exit code is 1 if any benchmark got slower than the
+tolerated ratio.
+"""
+
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+
+import bench_handlers
+
+
+def get_version():
+    """Get the version of pytroll-monitor being benchmarked."""
+    try:
+        from pytroll_monitor.version import version
+    except ImportError:
+        return "unknown"
+    return version
+
+
+def run_benchmarks():
+    """Run all the benchmarks available."""
+    results = bench_handlers.run()
+    try:
+        import bench_pps_message
+    except ImportError as err:
+        print("Skipping the PPS benchmarks: %s" % err, file=sys.stderr)
+    else:
+        results.update(bench_pps_message.run())
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print how the results compare to the baseline, return the names of the regressions."""
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            print("%-45s %12.1f us   (new)" % (name, seconds * 1e6))
+            continue
+        ratio = seconds / baseline[name]
+        print("%-45s %12.1f us   x%.2f" % (name, seconds * 1e6, ratio))
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(args=None):
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="json file to store the results in")
+    parser.add_argument("--compare", help="json file of earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="slowdown ratio above which a benchmark is a regression")
+    args = parser.parse_args(args)
+
+    results = run_benchmarks()
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump({"version": get_version(),
+                       "python": platform.python_version(),
+                       "machine": platform.machine(),
+                       "date": datetime.now(timezone.utc).isoformat(),
+                       "unit": "seconds per call",
+                       "results": results}, fd, indent=2)
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            return 1
+    else:
+        for name, seconds in results.items():
+            print("%-45s %12.1f us" % (name, seconds * 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
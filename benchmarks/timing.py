@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""Timing helpers for the benchmarks."""
+
+import timeit
+
+
+def time_per_call(func, repeat=5):
+    """Time a function, return the best time per call in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
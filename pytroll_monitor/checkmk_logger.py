@@ -30,7 +30,30 @@ OK, 1 = WARN, 2 = CRIT, and 3 = UNKNOWN.  Status starts at unknown.  When a
 message is logged with level warn, status is set to warn.  When a message is
 logged with level error or critical, status is set to critical.  When the
 message "All n files produced nominally" for n>0 is logged, status is set to
-OK.
+OK.  The status file is replaced atomically, so checkmk never reads a partly
+written file, and an unchanged status is rewritten at most once every
+``min_refresh_interval`` seconds.  With ``service_key``, a status is kept and
+reported for each logger name or product, with performance data.  With
+``window_minutes``, the status follows the error and warning rates over the
+last minutes instead of sticking to the last transition.
+
+The transitions are driven by rules, which can be given in the logging config
+or in a separate yaml file with ``rules: /path/to/rules.yaml``.  The first
+matching rule wins, for example::
+
+    - min_level: ERROR
+      status: CRIT
+    - logger: satpy.writers
+      min_level: WARNING
+      status: WARN
+    - max_level: INFO
+      message: "^All 0 files produced nominally"
+      status: WARN
+    - max_level: INFO
+      message: "files produced nominally"
+      status: OK
+      refresh: true
+      count_files: true
 
 For more information on checkmk local checks, see
 https://docs.checkmk.com/latest/en/localchecks.html
@@ -53,6 +76,7 @@ An example logging config illustrating how to use this::
         level: DEBUG
         formatter: pytroll
         status_file: /opt/pytroll/pytroll_inst/pytroll_status
+        min_refresh_interval: 60
     root:
       level: DEBUG
       handlers:
@@ -65,9 +89,23 @@ such as::
     satpy_launcher.py -n localhost trollflow2.yaml -c logging.yaml
 """
 
+import fcntl
 import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
 
+from contextlib import contextmanager
 from enum import IntEnum
+from re import _parser
+
+from pytroll_monitor.stats import HandlerStats
+
+logger = logging.getLogger(__name__)
 
 
 class ServiceStatus(IntEnum):
@@ -82,6 +120,410 @@ class ServiceStatus(IntEnum):
     UNKNOWN = 3
 
 
+DEFAULT_RULES = [
+    {"min_level": "ERROR", "status": "CRIT"},
+    {"min_level": "WARNING", "status": "WARN"},
+    {"max_level": "INFO", "message": "^All 0 files produced nominally", "status": "WARN",
+     "count_files": True},
+    {"max_level": "INFO", "message": "files produced nominally", "status": "OK",
+     "refresh": True, "count_files": True},
+]
+
+
+class Rule:
+    """A rule mapping some log records to a service status.
+
+    A record matches the rule if its level is within `min_level` and
+    `max_level`, if its logger is one of the `logger` names or a child of
+    one, and if the `message` regular expression is found in its message, each
+    of these being optional.  A matching record sets the service status to
+    `status`.  If `refresh` is set, the status file is refreshed even if the
+    status is unchanged.  If `count_files` is set, the number of files of an
+    "All n files produced nominally" message is counted.
+    """
+
+    __slots__ = ("status", "min_level", "max_level", "loggers", "logger_prefixes", "message",
+                 "regex", "literal", "refresh", "count_files")
+
+    def __init__(self, status, min_level=None, max_level=None, logger=None, message=None,
+                 refresh=False, count_files=False):
+        """Set up the rule, levels and status can be given by name."""
+        self.status = ServiceStatus[status] if isinstance(status, str) else ServiceStatus(status)
+        self.min_level = _get_levelno(min_level, 0)
+        self.max_level = _get_levelno(max_level, sys.maxsize)
+        if isinstance(logger, str):
+            logger = [logger]
+        self.loggers = tuple(logger) if logger else None
+        self.logger_prefixes = tuple(name + "." for name in self.loggers or ())
+        self.message = message
+        self.regex = re.compile(message) if message is not None else None
+        self.literal = _get_required_literal(self.regex) if message is not None else None
+        self.refresh = refresh
+        self.count_files = count_files
+
+    def matches_message(self, msg):
+        """Check if the message pattern is found in a message.
+
+        The text any match must contain is looked for first, which is much
+        cheaper than running the regular expression.
+        """
+        if self.literal is not None and self.literal not in msg:
+            return False
+        return self.regex.search(msg) is not None
+
+    def applies_to(self, levelno, name):
+        """Check the level and logger name of a record against the rule."""
+        return (self.min_level <= levelno <= self.max_level and
+                (self.loggers is None or name in self.loggers or name.startswith(self.logger_prefixes)))
+
+
+def _get_required_literal(regex):
+    """Get the longest text that any match of a regular expression contains, None if unknown."""
+    if regex.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = _parser.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    longest = current = ""
+    for op, value in parsed:
+        if op is _parser.LITERAL:
+            current += chr(value)
+            if len(current) > len(longest):
+                longest = current
+        else:
+            current = ""
+    return longest or None
+
+
+def _get_levelno(level, default):
+    if level is None:
+        return default
+    if isinstance(level, str):
+        return logging.getLevelNamesMapping()[level.upper()]
+    return level
+
+
+class RuleSet:
+    """Rules to find the service status of log records, the first matching rule wins.
+
+    The rules are filtered by level and logger name once for each pair of
+    them, so that matching a record costs a dictionary lookup and a check of
+    the message patterns of the remaining rules.  Most patterns require some
+    literal text, and these texts are looked for in the message all at once
+    first: when none is found, only the patterns without such a text are
+    run, so a message matching no rule costs about the same however many
+    rules there are.  Otherwise, each pattern is only run on the messages
+    containing its text.
+    """
+
+    def __init__(self, rules):
+        """Compile the rules, given as Rule objects or as dictionaries.
+
+        Raise a ValueError if a message pattern is invalid.
+        """
+        self.rules = []
+        for number, rule in enumerate(rules):
+            if not isinstance(rule, Rule):
+                try:
+                    rule = Rule(**rule)
+                except re.error as err:
+                    raise ValueError("Invalid message pattern %r in rule %d: %s" % (rule.get("message"),
+                                                                                  number, err))
+            self.rules.append(rule)
+        self._matchers = {}
+
+    @classmethod
+    def from_yaml(cls, filename):
+        """Load the rules from a yaml file holding a list of rules."""
+        import yaml
+
+        with open(filename, encoding="utf-8") as fd:
+            return cls(yaml.safe_load(fd))
+
+    def match(self, record):
+        """Find the rule matching a record.
+
+        Return the rule, or None, along with the record message if it was
+        needed for matching.
+        """
+        key = (record.levelno, record.name)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            matcher = self._matchers[key] = self._compile(*key)
+        message_rules, literals, unprefiltered_rules, default_rule = matcher
+        if not message_rules:
+            return default_rule, None
+        msg = record.getMessage()
+        if literals is not None and literals.search(msg) is None:
+            message_rules = unprefiltered_rules
+        for rule in message_rules:
+            if rule.matches_message(msg):
+                return rule, msg
+        return default_rule, msg
+
+    def _compile(self, levelno, name):
+        """Find the rules to check for the records of a level and logger name."""
+        message_rules = []
+        default_rule = None
+        for rule in self.rules:
+            if not rule.applies_to(levelno, name):
+                continue
+            if rule.message is None:
+                default_rule = rule
+                break
+            message_rules.append(rule)
+        literals = sorted({rule.literal for rule in message_rules if rule.literal is not None})
+        literals = re.compile("|".join(map(re.escape, literals))) if literals else None
+        unprefiltered_rules = tuple(rule for rule in message_rules if rule.literal is None)
+        return tuple(message_rules), literals, unprefiltered_rules, default_rule
+
+
+class RateWindow:
+    """Counts of records per level class over a sliding time window.
+
+    The window of `length` seconds is split in `buckets` time buckets kept in
+    a ring, so adding a record is O(1) and the memory is constant.  Records
+    below INFO are not counted.
+    """
+
+    __slots__ = ("bucket_length", "epochs", "infos", "warnings", "errors")
+
+    def __init__(self, length, buckets=10):
+        """Set up an empty window."""
+        self.bucket_length = length / buckets
+        self.epochs = [None] * buckets
+        self.infos = [0] * buckets
+        self.warnings = [0] * buckets
+        self.errors = [0] * buckets
+
+    def add(self, levelno, now):
+        """Count a record of the given level at time `now`."""
+        if levelno < logging.INFO:
+            return
+        epoch = int(now // self.bucket_length)
+        slot = epoch % len(self.epochs)
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            self.infos[slot] = self.warnings[slot] = self.errors[slot] = 0
+        if levelno >= logging.ERROR:
+            self.errors[slot] += 1
+        elif levelno >= logging.WARNING:
+            self.warnings[slot] += 1
+        else:
+            self.infos[slot] += 1
+
+    def get_counts(self, now):
+        """Get the counts of info, warning and error records in the window."""
+        oldest = int(now // self.bucket_length) - len(self.epochs)
+        infos = warnings = errors = 0
+        for slot, epoch in enumerate(self.epochs):
+            if epoch is not None and epoch > oldest:
+                infos += self.infos[slot]
+                warnings += self.warnings[slot]
+                errors += self.errors[slot]
+        return infos, warnings, errors
+
+
+class ServiceState:
+    """The status of a service along with its counts of notable records."""
+
+    __slots__ = ("status", "warnings", "errors", "files", "window")
+
+    def __init__(self, window=None):
+        """Start with an unknown status."""
+        self.status = ServiceStatus.UNKNOWN
+        self.warnings = 0
+        self.errors = 0
+        self.files = 0
+        self.window = window
+
+    def get_perfdata(self):
+        """Get the checkmk performance data for the counts."""
+        return f"warnings={self.warnings:d}|errors={self.errors:d}|files={self.files:d}"
+
+
+_FILES_PRODUCED = re.compile(r"All (\d+) files produced nominally")
+
+
+_SHARED_MAGIC = b"PTMS"
+_SHARED_HEADER = struct.Struct("<4sIQ")
+_SERVICE_NAME_SIZE = 64
+_SHARED_SLOT = struct.Struct("<iBxxxdQQQ%ds" % _SERVICE_NAME_SIZE)
+_SEVERITY = {ServiceStatus.OK: 0, ServiceStatus.UNKNOWN: 1, ServiceStatus.WARN: 2,
+             ServiceStatus.CRIT: 3}
+
+
+class SharedStatus:
+    """Service states shared by the processes reporting to the same status file.
+
+    The states live in a small memory-mapped file protected by a file lock,
+    with a slot for each process and service, so an update costs a few
+    bytes.  The aggregated status of a service is the worst status reported
+    by the live processes, or the last status reported if they are all gone,
+    and its counts are summed over all the processes.  One process at a time
+    holds the writer lock and writes the aggregated status file.
+    """
+
+    def __init__(self, filename, slots=256):
+        """Open the shared file, creating it with room for `slots` slots if needed."""
+        self.filename = filename
+        self.slots = slots
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._writer_fd = None
+        self._slot_indices = {}
+        self._thread_lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        """Open and map the shared file, in this process."""
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _SHARED_HEADER.size, 0)
+            if len(header) < _SHARED_HEADER.size:
+                header = _SHARED_HEADER.pack(_SHARED_MAGIC, self.slots, 0)
+                os.pwrite(fd, header, 0)
+            magic, self.slots, _ = _SHARED_HEADER.unpack(header)
+            if magic != _SHARED_MAGIC:
+                raise ValueError("%s is not a shared status file" % self.filename)
+            size = _SHARED_HEADER.size + self.slots * _SHARED_SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._pid = os.getpid()
+        self._writer_fd = None
+        self._slot_indices = {}
+
+    @contextmanager
+    def _locked(self):
+        """Lock the shared file, reopening it in a forked child."""
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def generation(self):
+        """Get the number of updates done so far."""
+        return _SHARED_HEADER.unpack_from(self._map)[2]
+
+    def update(self, service, state):
+        """Update the state of a service for this process."""
+        name = _encode_service(service)
+        with self._locked():
+            pid = self._pid
+            index = self._slot_indices.get(name)
+            if index is None or self._read_slot(index)[0] != pid:
+                index = self._slot_indices[name] = self._find_slot(pid, name)
+            _SHARED_SLOT.pack_into(self._map, _slot_offset(index), pid, state.status, time.time(),
+                                   state.warnings, state.errors, state.files, name)
+            magic, slots, generation = _SHARED_HEADER.unpack_from(self._map)
+            _SHARED_HEADER.pack_into(self._map, 0, magic, slots, generation + 1)
+
+    def _read_slot(self, index):
+        return _SHARED_SLOT.unpack_from(self._map, _slot_offset(index))
+
+    def _find_slot(self, pid, name):
+        """Find the slot of a process and service, or a free one."""
+        free = None
+        for index in range(self.slots):
+            slot_pid, *_, slot_name = self._read_slot(index)
+            if slot_pid == pid and slot_name == name:
+                return index
+            if free is None and slot_pid == 0:
+                free = index
+        if free is not None:
+            return free
+        dead = [(self._read_slot(index)[2], index) for index in range(self.slots)
+                if not _is_alive(self._read_slot(index)[0])]
+        if not dead:
+            raise RuntimeError("No free slot left in %s" % self.filename)
+        return min(dead)[1]
+
+    def aggregate(self):
+        """Get the aggregated states of the services of all the processes."""
+        with self._locked():
+            slots = [self._read_slot(index) for index in range(self.slots)]
+        services = {}
+        latest = {}
+        alive = {}
+        for pid, status, updated, warnings, errors, files, name in slots:
+            if pid == 0:
+                continue
+            service = _decode_service(name)
+            state = services.get(service)
+            if state is None:
+                state = services[service] = ServiceState()
+            state.warnings += warnings
+            state.errors += errors
+            state.files += files
+            status = ServiceStatus(status)
+            if _is_alive(pid):
+                if not alive.get(service) or _SEVERITY[status] > _SEVERITY[state.status]:
+                    state.status = status
+                alive[service] = True
+            elif not alive.get(service) and updated >= latest.get(service, updated):
+                latest[service] = updated
+                state.status = status
+        return services
+
+    def acquire_writer(self):
+        """Try to become the process writing the status file."""
+        if self._writer_fd is not None and self._pid == os.getpid():
+            return True
+        if self._pid != os.getpid():
+            self._open()
+        fd = os.open(self.filename + ".writer", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._writer_fd = fd
+        return True
+
+    def release_writer(self):
+        """Let another process write the status file."""
+        if self._writer_fd is not None and self._pid == os.getpid():
+            os.close(self._writer_fd)
+        self._writer_fd = None
+
+
+def _slot_offset(index):
+    return _SHARED_HEADER.size + index * _SHARED_SLOT.size
+
+
+def _encode_service(service):
+    if service is None:
+        return b""
+    return str(service).encode("utf-8")[:_SERVICE_NAME_SIZE]
+
+
+def _decode_service(name):
+    name = name.rstrip(b"\0").decode("utf-8", "replace")
+    return name or None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
 class Trollflow2CheckMKHandler(logging.Handler):
     """Handler to report checkmk local for use with trollflow2.
 
@@ -89,46 +531,293 @@ class Trollflow2CheckMKHandler(logging.Handler):
     is logged with level WARNING, it will set a checkmk status to WARN.  If any
     message is logged with a worse level, it will set a checkmk status to
     CRITICAL.  When trollflow2 reports that all files are produced nominally,
-    it will set status to OK, unless the number is zero.
+    it will set status to OK, unless the number is zero.  These transitions
+    are the default rules, other rules can be configured.
+
+    If `service_key` is given, a status is kept per service instead.  The
+    service of a record is its logger name if the key is "name", or else
+    the record attribute of that name, for example "product" or "area" when
+    passed in the `extra` of the logging call.  Records without it go to the
+    default service.  Each service gets a line in the status file, with the
+    counts of warnings, errors and produced files as performance data.
+
+    If `window_minutes` is given, the statuses are not sticky anymore but
+    derived from the rates of records in the last `window_minutes` minutes,
+    among the records of level INFO or higher: the status is CRIT if the
+    error rate reaches `crit_rate`, WARN if it reaches `warn_rate` or if the
+    warning rate reaches `warning_rate`, and OK otherwise.  The statuses are
+    re-evaluated as the window slides, so they recover once the errors are
+    out of the window even if nothing is logged anymore.
+
+    If `shared_file` is given, the handlers of all the processes using it
+    share their statuses through it, see :class:`SharedStatus`.  The status
+    changes of each process are then only written to the shared file, and one
+    of the processes writes the aggregated status file, checking for updates
+    every `poll_interval` seconds.
+
+    The health of the handler is available from :meth:`stats`, the sent
+    records being the status updates written, and is logged every
+    `stats_interval` seconds if given.
     """
 
     service_name = '"Pytroll status report"'
 
-    def __init__(self, status_file):
+    def __init__(self, status_file, min_refresh_interval=60, service_key=None, rules=None,
+                 window_minutes=None, window_buckets=10, warn_rate=.05, crit_rate=.2,
+                 warning_rate=.5, shared_file=None, poll_interval=1, stats_interval=None):
         """Initialise the logger.
 
         The status_file should be the file where checkmk will check the status.
+        An unchanged status is written again at most every
+        min_refresh_interval seconds, and so are the changed counts of
+        warnings, errors and files, at the latest min_refresh_interval
+        seconds after the previous write.  The rules deciding the status default to
+        DEFAULT_RULES, and can be given as a list of rules or as the name of a
+        yaml file holding them, see :class:`Rule`.
         """
         super().__init__()
+        self._stats = HandlerStats(stats_interval)
         self.status_file = status_file
-        self.status = ServiceStatus.UNKNOWN
-        self.write_status_to_file()
+        self.min_refresh_interval = min_refresh_interval
+        self.service_key = service_key
+        if rules is None:
+            rules = DEFAULT_RULES
+        if isinstance(rules, str):
+            self.rules = RuleSet.from_yaml(rules)
+        elif isinstance(rules, RuleSet):
+            self.rules = rules
+        else:
+            self.rules = RuleSet(rules)
+        self.window_minutes = window_minutes
+        self.window_buckets = window_buckets
+        self.warn_rate = warn_rate
+        self.crit_rate = crit_rate
+        self.warning_rate = warning_rate
+        self.services = {None: self._new_service_state()}
+        self._last_write = None
+        self._unwritten = {}
+        self._write_timer = None
+        self.shared = None
+        if shared_file is not None:
+            self.shared = SharedStatus(shared_file)
+            self.poll_interval = poll_interval
+            self._last_writer_attempt = None
+            self._writer_thread = None
+            self._stop_writer = threading.Event()
+            self._check_writer()
+        else:
+            self.write_status_to_file()
+        self._window_thread = None
+        if window_minutes is not None:
+            self._stop_window = threading.Event()
+            self._window_thread = threading.Thread(target=self._slide_windows, daemon=True)
+            self._window_thread.start()
+
+    @property
+    def status(self):
+        """Get the status of the default service."""
+        return self.services[None].status
+
+    @status.setter
+    def status(self, status):
+        """Set the status of the default service."""
+        self.services[None].status = status
+
+    def get_service(self, record):
+        """Get the service a record reports on, None for the default service."""
+        if self.service_key is None:
+            return None
+        if self.service_key == "name":
+            return record.name
+        return getattr(record, self.service_key, None)
+
+    def handle(self, record):
+        """Count the record in, and handle it."""
+        self._stats.records_in += 1
+        self._stats.report(self, logger)
+        return super().handle(record)
+
+    def stats(self):
+        """Get the health statistics of the handler."""
+        stats = self._stats.as_dict()
+        stats["services"] = len(self.services)
+        return stats
 
     def emit(self, record):
         """Update the status based on the logging.
 
-        Update the state based on the logging.  If a message is logged with
-        level error or worse, set it to critical.  If logged with level
-        warning, set it to warning.  If a message that all non-zero files are
-        produced nominally is emitted, set it to all OK.  Update the status
-        file if the status has changed.  Also update the status if all is still
-        good, so the status does not become too old.
+        Update the state based on the first matching rule.  With the default
+        rules, if a message is logged with level error or worse, set it to
+        critical.  If logged with level warning, set it to warning.  If a
+        message that all non-zero files are produced nominally is emitted, set
+        it to all OK.  Update the status file if the status has changed.  Also
+        update the status if all is still good, so the status does not become
+        too old, unless it was written less than min_refresh_interval seconds
+        ago.
+        """
+        self._update_state(record)
+
+    def handle_event(self, event):
+        """Update the status from a status event of a fan-out handler.
+
+        See :class:`pytroll_monitor.fanout.FanOutHandler`.
         """
-        update = False
-        stat = self.status
+        self._stats.records_in += 1
+        with self.lock:
+            self._update_state(event)
+
+    def _update_state(self, record):
+        """Update the state of the service of a record, or of an event."""
+        service = self.get_service(record)
+        rule, msg = self.rules.match(record)
+        state = self.services.get(service)
+        if state is None:
+            if rule is None and record.levelno < logging.WARNING:
+                # Not worth a service, eg the debug messages of a chatty logger
+                return
+            state = self.services[service] = self._new_service_state()
+        counted = record.levelno >= logging.WARNING
         if record.levelno >= logging.ERROR:
-            stat = ServiceStatus.CRIT
-        elif record.levelno >= logging.WARNING:
-            stat = ServiceStatus.WARN
-        elif record.levelno <= logging.INFO:
-            if record.msg.startswith("All 0 files produced nominally"):
-                stat = ServiceStatus.WARN
-            elif "files produced nominally" in record.msg:
-                stat = ServiceStatus.OK
-                update = True
-        if update or stat != self.status:  # status has changed, update file
-            self.status = stat
+            state.errors += 1
+        elif counted:
+            state.warnings += 1
+        if rule is not None and rule.count_files:
+            match = _FILES_PRODUCED.match(record.getMessage() if msg is None else msg)
+            if match:
+                state.files += int(match.group(1))
+                counted = True
+        if state.window is not None:
+            now = time.monotonic()
+            state.window.add(record.levelno, now)
+            stat = self._get_window_status(state.window, now)
+        elif rule is None:
+            stat = state.status
+        else:
+            stat = rule.status
+        if stat != state.status:  # status has changed, update file
+            state.status = stat
+            self._update(service, state)
+        elif rule is not None and rule.refresh and self._is_stale():
+            self._update(service, state)
+        elif counted:
+            # Only the counts changed, write them without rewriting the file for each record
+            self._unwritten[service] = state
+            self._schedule_write()
+
+    def _schedule_write(self):
+        """Write the unwritten counts now, or once min_refresh_interval is over."""
+        if self._write_timer is not None:
+            return
+        if self._last_write is None:
+            delay = 0
+        else:
+            delay = self.min_refresh_interval - (time.monotonic() - self._last_write)
+        if delay <= 0:
+            self.flush()
+        else:
+            self._write_timer = threading.Timer(delay, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self):
+        """Write the counts changed since the last write."""
+        with self.lock:
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+                self._write_timer = None
+            for service, state in list(self._unwritten.items()):
+                self._update(service, state)
+
+    def refresh_windows(self):
+        """Re-evaluate the window statuses, as records leave the windows."""
+        with self.lock:
+            now = time.monotonic()
+            for service, state in list(self.services.items()):
+                stat = self._get_window_status(state.window, now)
+                if stat != state.status:
+                    state.status = stat
+                    self._update(service, state)
+
+    def _slide_windows(self):
+        """Refresh the window statuses every time the window slides by a bucket."""
+        while not self._stop_window.wait(self.window_minutes * 60 / self.window_buckets):
+            try:
+                self.refresh_windows()
+            except Exception:
+                logger.exception("Could not refresh the window statuses")
+
+    def _update(self, service, state):
+        """Write the new state of a service, or share it."""
+        if self.shared is None:
+            self._unwritten.clear()
             self.write_status_to_file()
+        else:
+            self._unwritten.pop(service, None)
+            start = time.perf_counter()
+            self.shared.update(service, state)
+            self._stats.send_time.add(time.perf_counter() - start)
+            self._stats.records_sent += 1
+            self._last_write = time.monotonic()
+            self._check_writer()
+
+    def _check_writer(self):
+        """Become the writer of the status file if no other process is."""
+        if self._writer_thread is not None:
+            return
+        now = time.monotonic()
+        if self._last_writer_attempt is not None and now - self._last_writer_attempt < self.poll_interval:
+            return
+        self._last_writer_attempt = now
+        if self.shared.acquire_writer():
+            self.write_status_to_file()
+            self._writer_thread = threading.Thread(target=self._write_shared_status, daemon=True)
+            self._writer_thread.start()
+
+    def _write_shared_status(self):
+        """Write the aggregated status file when the shared states change."""
+        generation = self.shared.generation
+        while not self._stop_writer.wait(self.poll_interval):
+            if self.shared.generation != generation:
+                generation = self.shared.generation
+                self.write_status_to_file()
+
+    def close(self):
+        """Close the handler, letting another process write the shared status."""
+        self.flush()
+        if self._window_thread is not None:
+            self._stop_window.set()
+            self._window_thread.join()
+            self._window_thread = None
+        if self.shared is not None and self._writer_thread is not None:
+            self._stop_writer.set()
+            self._writer_thread.join()
+            self.write_status_to_file()
+            self.shared.release_writer()
+            self._writer_thread = None
+        super().close()
+
+    def _new_service_state(self):
+        """Create the state of a new service."""
+        if self.window_minutes is None:
+            return ServiceState()
+        return ServiceState(RateWindow(self.window_minutes * 60, self.window_buckets))
+
+    def _get_window_status(self, window, now):
+        """Get the status from the rates of records in the window."""
+        infos, warnings, errors = window.get_counts(now)
+        total = infos + warnings + errors
+        if not total:
+            return ServiceStatus.UNKNOWN
+        if errors >= self.crit_rate * total:
+            return ServiceStatus.CRIT
+        if errors >= self.warn_rate * total or warnings >= self.warning_rate * total:
+            return ServiceStatus.WARN
+        return ServiceStatus.OK
+
+    def _is_stale(self):
+        """Check if the status file is due for a refresh."""
+        return (self._last_write is None or
+                time.monotonic() - self._last_write >= self.min_refresh_interval)
 
     def get_status_line(self):
         """Get the checkmk status line.
@@ -139,8 +828,71 @@ class Trollflow2CheckMKHandler(logging.Handler):
         return (f"{self.status:d} {self.service_name:s} "
                 "- Pytroll lives!")
 
+    def get_status_lines(self, services=None):
+        """Get the checkmk status lines of all the services.
+
+        The services default to the ones of this handler.  The services with
+        an unknown status are left out, the default service being reported
+        only if no other service is.
+        """
+        if services is None:
+            services = self.services
+        if self.service_key is None:
+            status = services[None].status if None in services else ServiceStatus.UNKNOWN
+            return [f"{status:d} {self.service_name:s} - Pytroll lives!"]
+        lines = []
+        default = None
+        for service, state in services.items():
+            if service is None:
+                name = self.service_name
+            else:
+                name = '"Pytroll status report %s"' % _sanitize(service)
+            line = f"{state.status:d} {name:s} {state.get_perfdata():s} Pytroll lives!"
+            if service is None and state.status == ServiceStatus.UNKNOWN:
+                default = line
+            elif state.status != ServiceStatus.UNKNOWN:
+                lines.append(line)
+        if not lines and default is not None:
+            lines.append(default)
+        return lines
+
     def write_status_to_file(self):
         """Update the status in the status file."""
-        status_line = self.get_status_line()
-        with open(self.status_file, "wt", encoding="ascii") as fp:
-            fp.write(status_line)
+        start = time.perf_counter()
+        if self.shared is None:
+            lines = self.get_status_lines()
+        else:
+            lines = self.get_status_lines({None: ServiceState(), **self.shared.aggregate()})
+        try:
+            write_file_atomically(self.status_file, "\n".join(lines))
+        except OSError:
+            self._stats.failures += 1
+            raise
+        self._last_write = time.monotonic()
+        if self.shared is None:
+            self._stats.send_time.add(time.perf_counter() - start)
+            self._stats.records_sent += 1
+
+
+def _sanitize(service):
+    """Make a service fit in a quoted checkmk service name."""
+    return str(service).replace('"', "'").replace("\n", " ").encode("ascii", "replace").decode()
+
+
+def write_file_atomically(filename, contents):
+    """Write a text file so that readers see either the old or the new contents.
+
+    The contents are written to a temporary file next to the file, which is
+    then renamed to replace it.
+    """
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        with open(tmp_filename, "wt", encoding="ascii") as fp:
+            fp.write(contents)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A logging handler feeding several monitoring backends at once.
+
+Attaching an OP5 handler and a checkmk handler to the same logger makes
+each of them filter and format every record on its own, and each async
+handler runs its own queue and thread.  The fan-out handler filters and
+formats a record once, into a compact
+:class:`pytroll_monitor.op5_logger.StatusEvent`, and hands the event to each
+of its backends.  The async version does so from a single worker thread.
+
+An example logging config illustrating how to use this::
+
+    handlers:
+      monitoring:
+        (): pytroll_monitor.fanout.AsyncFanOutHandler
+        level: INFO
+        op5:
+          service: that_service_we_should_monitor
+          server: http://myop5server.com/some/service
+          host: server_we_run_stuff_on
+        checkmk:
+          status_file: /tmp/pytroll_status
+        posttroll:
+          topic: /pytroll/monitor/status
+    root:
+      level: DEBUG
+      handlers:
+        - monitoring
+"""
+
+import logging
+from datetime import datetime
+
+from pytroll_monitor.op5_logger import AsyncHandler, OP5Handler, StatusEvent
+from pytroll_monitor.stats import HandlerStats
+
+logger = logging.getLogger(__name__)
+
+
+class PosttrollStatusBackend(object):
+    """A backend publishing the status events on posttroll.
+
+    The events of level `min_level` or above are published with the `topic`
+    through the process-wide publisher of
+    :func:`pytroll_monitor.pps_posttroll_hook.get_publisher`.
+    """
+
+    def __init__(self, topic="/pytroll/monitor/status", min_level=logging.WARNING):
+        """Init the backend."""
+        self.topic = topic
+        if isinstance(min_level, str):
+            min_level = logging.getLevelName(min_level)
+        self.min_level = min_level
+
+    def handle_event(self, event):
+        """Publish the event."""
+        if event.levelno < self.min_level:
+            return
+        from posttroll.message import Message
+
+        from pytroll_monitor.pps_posttroll_hook import get_publisher
+        data = {"status": event.status,
+                "level": event.levelname,
+                "logger": event.name,
+                "message": event.msg,
+                "time": datetime.fromtimestamp(event.created)}
+        get_publisher().send(Message(self.topic, "info", data).encode())
+
+    def flush(self):
+        """Nothing to flush, the publisher sends at once."""
+
+    def close(self):
+        """Nothing to close, the publisher is stopped at exit."""
+
+
+class FanOutHandler(logging.Handler):
+    """Handler formatting each record once for several backends.
+
+    The backends are objects with a `handle_event` method taking a
+    :class:`pytroll_monitor.op5_logger.StatusEvent`, a `flush` and a `close`
+    method, as the OP5 and checkmk handlers have.  They are given as
+    `backends`, and/or created from the keyword arguments of an
+    :class:`pytroll_monitor.op5_logger.OP5Handler` as `op5`, of a
+    :class:`pytroll_monitor.checkmk_logger.Trollflow2CheckMKHandler` as
+    `checkmk`, and of a :class:`PosttrollStatusBackend` as `posttroll`.
+
+    The levels and filters of the handler apply to all the backends.  An
+    error in one backend is reported and does not keep the others from
+    getting the event.
+    """
+
+    def __init__(self, backends=None, op5=None, checkmk=None, posttroll=None, stats_interval=None,
+                 **kwargs):
+        """Init the handler and create its backends."""
+        super().__init__(**kwargs)
+        self._stats = HandlerStats(stats_interval)
+        self.backends = list(backends or [])
+        if op5 is not None:
+            self.backends.append(OP5Handler(**op5))
+        if checkmk is not None:
+            from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+            self.backends.append(Trollflow2CheckMKHandler(**checkmk))
+        if posttroll is not None:
+            self.backends.append(PosttrollStatusBackend(**posttroll))
+
+    def handle(self, record):
+        """Count the record in, and handle it."""
+        self._stats.records_in += 1
+        self._stats.report(self, logger)
+        return super().handle(record)
+
+    def stats(self):
+        """Get the health statistics of the handler and of its backends."""
+        stats = self._stats.as_dict()
+        stats["backends"] = [backend.stats() for backend in self.backends if hasattr(backend, "stats")]
+        return stats
+
+    def emit(self, record):
+        """Emit the record to the backends."""
+        try:
+            event = StatusEvent.from_record(record, self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        self.emit_event(event)
+
+    def emit_event(self, event):
+        """Hand the status event to each backend."""
+        for backend in self.backends:
+            try:
+                backend.handle_event(event)
+            except Exception:
+                self._stats.failures += 1
+                self.handleError(event.to_record())
+        self._stats.records_sent += 1
+
+    def flush(self):
+        """Flush the backends."""
+        for backend in self.backends:
+            backend.flush()
+
+    def close(self):
+        """Close the backends, and the handler."""
+        for backend in self.backends:
+            backend.close()
+        super().close()
+
+
+class AsyncFanOutHandler(AsyncHandler, FanOutHandler):
+    """Async version of the FanOutHandler.
+
+    The records are filtered and formatted by the caller, and the status
+    events are handed to all the backends from the worker thread.
+    """
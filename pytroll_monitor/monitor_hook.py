@@ -24,60 +24,229 @@
 
 import os
 import logging
+import threading
+import time
 import requests
-import json
-from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+
+from pytroll_monitor.relay import send_to_relay
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = (3.05, 10)
+
+
+class CircuitOpenError(requests.RequestException):
+    """The monitor server is considered down, the message was not sent."""
+
+
+class CircuitBreaker(object):
+    """A circuit breaker failing fast while a server is down.
+
+    After `failure_threshold` consecutive failures the circuit opens, and
+    calls fail at once for `reset_timeout` seconds.  Then a single call is
+    let through to probe the server: the circuit closes again if it
+    succeeds, and opens for another period if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Init the breaker, closed."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Get the state of the circuit, "closed", "open" or "half-open"."""
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Check that a call can be made, raise CircuitOpenError otherwise."""
+        if self._opened_at is None:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit to the monitor server is open")
+            self._probing = True
+
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        if self.failures or self._opened_at is not None:
+            with self._lock:
+                self.failures = 0
+                self._opened_at = None
+                self._probing = False
+
+    def cancel_call(self):
+        """Let another call probe the server, after a call that failed for another reason."""
+        if self._probing:
+            with self._lock:
+                self._probing = False
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
 
 class OP5Monitor(object):
     """A class to trigger the sending of a notification to an Op5 monitor server."""
 
-    def __init__(self, monitor_service, monitor_server, monitor_host, monitor_auth=None):
-        """Init the monitor."""
+    def __init__(self, monitor_service, monitor_server, monitor_host, monitor_auth=None,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, failure_threshold=5,
+                 reset_timeout=30):
+        """Init the monitor.
+
+        The statuses are sent through a pooled session keeping up to
+        `pool_size` connections to the monitor server alive.  The `timeout`
+        in seconds is either a (connect, read) pair or a single value for both.
+        After `failure_threshold` consecutive failures, sending fails fast
+        with a CircuitOpenError for `reset_timeout` seconds, see
+        :class:`CircuitBreaker`.  A `failure_threshold` of None disables this.
+        """
         self.monitor_auth = monitor_auth
         if self.monitor_auth:
             self.monitor_auth = tuple(monitor_auth)
         self.monitor_service = monitor_service
         self.monitor_server = monitor_server
         self.monitor_host = monitor_host
+        self.pool_size = pool_size
+        self.timeout = _get_timeout(timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breaker = self._create_breaker()
+        self._session = None
+        self._session_pid = None
+
+    def _create_breaker(self):
+        if not self.failure_threshold:
+            return None
+        return CircuitBreaker(self.failure_threshold, self.reset_timeout)
 
     def __getstate__(self):
         """Get state."""
         d__ = {'monitor_auth': self.monitor_auth,
                'monitor_service': self.monitor_service,
                'monitor_server': self.monitor_server,
-               'monitor_host': self.monitor_host}
+               'monitor_host': self.monitor_host,
+               'pool_size': self.pool_size,
+               'timeout': self.timeout,
+               'failure_threshold': self.failure_threshold,
+               'reset_timeout': self.reset_timeout}
         return d__
 
     def __setstate__(self, mydict):
         """Set state."""
-        monitor_auth = mydict.get('monitor_auth')
-        if monitor_auth:
-            self.monitor_auth = tuple(monitor_auth)
+        self.monitor_auth = mydict.get('monitor_auth')
+        if self.monitor_auth:
+            self.monitor_auth = tuple(self.monitor_auth)
         self.monitor_service = mydict['monitor_service']
         self.monitor_server = mydict['monitor_server']
         self.monitor_host = mydict['monitor_host']
+        self.pool_size = mydict.get('pool_size', DEFAULT_POOL_SIZE)
+        self.timeout = _get_timeout(mydict.get('timeout', DEFAULT_TIMEOUT))
+        self.failure_threshold = mydict.get('failure_threshold', 5)
+        self.reset_timeout = mydict.get('reset_timeout', 30)
+        self.breaker = self._create_breaker()
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        """Get the keep-alive session to the monitor server.
+
+        The session is created on first use, and created anew in a forked
+        child so that the connections of the parent are never shared.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.auth = self.monitor_auth
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def close(self):
+        """Close the connections to the monitor server."""
+        if self._session is not None and self._session_pid == os.getpid():
+            self._session.close()
+        self._session = None
 
     def __call__(self, status, msg):
-        """Call the hook and send a status."""
+        """Call the hook and send a status.
+
+        The status is handed to the relay daemon if one is configured and
+        running, see :mod:`pytroll_monitor.relay`, and sent directly otherwise.
+        """
         LOG.debug("Service = %s", str(self.monitor_service))
         LOG.debug("Server = %s", str(self.monitor_server))
         LOG.debug("Host = %s", str(self.monitor_host))
 
+        if send_to_relay({"op5": {"server": self.monitor_server,
+                                  "host": self.monitor_host,
+                                  "service": self.monitor_service,
+                                  "status": status,
+                                  "msg": msg}}):
+            LOG.debug("Status handed to the relay")
+            return
+
         retv = self.send_message(status, msg)
 
         LOG.debug("Request done: %s", retv.text)
 
-    def send_message(self, status, msg):
-        """Send the message to the monitor server."""
-        json_data = {"host_name": self.monitor_host,
-                     "service_description": self.monitor_service,
+    def send_message(self, status, msg, service=None, host=None):
+        """Send the message to the monitor server.
+
+        The service and host default to the ones of the monitor.  Raise a
+        CircuitOpenError without sending if the server is considered down.
+        """
+        json_data = {"host_name": host or self.monitor_host,
+                     "service_description": service or self.monitor_service,
                      "status_code": status,
                      "plugin_output": msg}
-        with requests.post(self.monitor_server,
-                           auth=self.monitor_auth,
-                           json=json_data) as response:
+        if self.breaker is None:
+            return self._post(json_data)
+        self.breaker.before_call()
+        try:
+            response = self._post(json_data)
+        except requests.RequestException as err:
+            if err.response is None or err.response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # Not telling whether the server is up, so don't stay half-open forever
+            self.breaker.cancel_call()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _post(self, json_data):
+        with self.session.post(self.monitor_server,
+                               json=json_data,
+                               timeout=self.timeout) as response:
             response.raise_for_status()
             return response
+
+
+def _get_timeout(timeout):
+    """Get a timeout from the config, where pairs come as lists."""
+    if isinstance(timeout, list):
+        return tuple(timeout)
+    return timeout
@@ -21,69 +21,816 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """A logger sending statuses to monitor."""
 
+import asyncio
 import logging
+import re
 import sys
-from queue import Queue
+import time
+import traceback
+import weakref
+from collections import Counter, deque
+from queue import Full, Queue
 from socket import gaierror
-from threading import Thread
+from threading import Event, Lock, Thread, Timer, current_thread
 
-from pytroll_monitor.monitor_hook import OP5Monitor
+from requests import RequestException
+
+from pytroll_monitor.monitor_hook import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, CircuitOpenError, OP5Monitor
+from pytroll_monitor.spool import StatusSpool
+from pytroll_monitor.stats import HandlerStats
 
 logger = logging.getLogger(__name__)
 
 
+def get_op5_status(levelno):
+    """Get the OP5 status code for a logging level.
+
+    Return None for levels that are not worth a status.
+    """
+    if levelno >= logging.ERROR:
+        return 2
+    if levelno >= logging.WARNING:
+        return 1
+    if levelno >= logging.INFO:
+        return 0
+    return None
+
+
+def _is_transient(err):
+    """Check if sending a status failed for a reason that could go away.
+
+    Connection errors and server errors are transient, while a status
+    rejected by the server (a 4xx error) would be rejected again.
+    """
+    response = getattr(err, "response", None)
+    return response is None or response.status_code >= 500
+
+
+class StatusFilter(logging.Filter):
+    """Filter the records worth a status.
+
+    The records with a level below INFO are never sent as statuses.  If
+    `allow` is given, only the records of these loggers and their children
+    pass; the records of the loggers in `deny` and their children are
+    rejected, the most specific logger name deciding.  The records whose
+    message is found by any of the `ignore_messages` regular expressions are
+    rejected too.
+
+    Being a logging filter, it is applied by the handler on the caller
+    thread, so the rejected records are neither formatted nor queued.  More
+    predicates can be added to the handler as filters, see
+    :meth:`logging.Handler.addFilter`.
+    """
+
+    def __init__(self, allow=None, deny=None, ignore_messages=None):
+        """Init the filter."""
+        super().__init__()
+        self.allow = list(allow) if allow is not None else None
+        self.deny = list(deny or [])
+        self.ignore_messages = None
+        if ignore_messages:
+            self.ignore_messages = re.compile("|".join("(?:%s)" % pattern for pattern in ignore_messages))
+        self._allowed = {}
+
+    def filter(self, record):
+        """Check that a record is worth a status."""
+        if get_op5_status(record.levelno) is None:
+            return False
+        allowed = self._allowed.get(record.name)
+        if allowed is None:
+            allowed = self._allowed[record.name] = self._is_allowed(record.name)
+        if not allowed:
+            return False
+        return self.ignore_messages is None or self.ignore_messages.search(record.getMessage()) is None
+
+    def _is_allowed(self, name):
+        """Check if the records of a logger are allowed."""
+        allowed = self.allow is None
+        specificity = -1
+        for prefixes, decision in ((self.allow or [], True), (self.deny, False)):
+            for prefix in prefixes:
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) >= specificity:
+                    allowed = decision
+                    specificity = len(prefix)
+        return allowed
+
+
+_LOG_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class StatusEvent:
+    """A compact status event, made of a formatted log record.
+
+    The event holds the level, the OP5 status, the formatted message `msg`
+    and the record message `message`, the logger name, the creation time and
+    the extra attributes of the record, which are available as attributes of
+    the event.  The arguments, exception info and stack of the record are not
+    kept.
+    """
+
+    __slots__ = ("levelno", "status", "msg", "message", "name", "created", "extra")
+
+    def __init__(self, levelno, status, msg, message, name, created, extra=None):
+        """Init the event."""
+        self.levelno = levelno
+        self.status = status
+        self.msg = msg
+        self.message = message
+        self.name = name
+        self.created = created
+        self.extra = extra
+
+    @classmethod
+    def from_record(cls, record, msg):
+        """Make the event of a record formatted as `msg`."""
+        message = record.__dict__.get("message")
+        if message is None:
+            message = record.getMessage()
+        extra = {key: value for key, value in vars(record).items() if key not in _LOG_RECORD_ATTRIBUTES}
+        return cls(record.levelno, get_op5_status(record.levelno), msg, message, record.name,
+                   record.created, extra or None)
+
+    def __getattr__(self, name):
+        """Get an extra attribute of the record."""
+        if self.extra is not None and name in self.extra:
+            return self.extra[name]
+        raise AttributeError("%r object has no attribute %r" % (type(self).__name__, name))
+
+    @property
+    def levelname(self):
+        """Get the name of the level."""
+        return logging.getLevelName(self.levelno)
+
+    def getMessage(self):
+        """Get the record message, as for a log record."""
+        return self.message
+
+    def to_record(self):
+        """Make a log record of the event, for error reports."""
+        return logging.makeLogRecord(dict(self.extra or (), name=self.name, levelno=self.levelno,
+                                          levelname=self.levelname, msg=self.message,
+                                          created=self.created))
+
+
+class _PendingStatus:
+    """A status folded from the records of a coalescing window."""
+
+    __slots__ = ("status", "msg", "record", "suppressed")
+
+    def __init__(self, status, msg, record):
+        """Start the window with the first record."""
+        self.status = status
+        self.msg = msg
+        self.record = record
+        self.suppressed = 0
+
+    def add(self, status, msg, record):
+        """Fold a record in, the latest of the worst statuses wins."""
+        self.suppressed += 1
+        if status >= self.status:
+            self.status = status
+            self.msg = msg
+            self.record = record
+
+    def get_plugin_output(self):
+        """Get the message to send, with the count of suppressed messages."""
+        if self.suppressed:
+            return "%s (+%d suppressed)" % (self.msg, self.suppressed)
+        return self.msg
+
+
 class OP5Handler(logging.Handler):
-    """Monitoring handler."""
+    """Monitoring handler.
 
-    def __init__(self, service, server, host, auth=None):
+    If `flush_interval` is given (in seconds), the records arriving within
+    that interval are coalesced into a single status: the worst status wins,
+    and its latest message is sent along with the number of suppressed
+    messages.
+
+    If `spool_dir` is given, the statuses that cannot be delivered are kept
+    in an on-disk spool, see :class:`pytroll_monitor.spool.StatusSpool`,
+    and replayed every `replay_interval` seconds until the server is back.
+
+    The requests time out after `timeout` seconds, and after
+    `failure_threshold` consecutive failures the statuses are dropped (or
+    spooled) at once for `reset_timeout` seconds instead of being sent, see
+    :class:`pytroll_monitor.monitor_hook.CircuitBreaker`.
+
+    The health of the handler is available from :meth:`stats`, and is logged
+    every `stats_interval` seconds if given.
+
+    Only the records worth a status are handled, as decided by the
+    :class:`StatusFilter` made of the `allow` and `deny` logger names and the
+    `ignore_messages` patterns.
+
+    The statuses go to the `service` of the `host` by default.  To report on
+    several services, `services` maps logger names to service names, or to
+    dictionaries with a `service` and a `host`, the most specific logger name
+    deciding; and the `service_key` attribute of a record, if present, names
+    the service of the record directly.  The statuses of all the services are
+    sent through the same connections, and coalesced per service.
+    """
+
+    def __init__(self, service, server, host, auth=None, pool_size=DEFAULT_POOL_SIZE,
+                 flush_interval=None, spool_dir=None, spool_segment_size=1024 * 1024,
+                 spool_max_segments=10, replay_interval=30, timeout=DEFAULT_TIMEOUT,
+                 failure_threshold=5, reset_timeout=30, stats_interval=None, allow=None,
+                 deny=None, ignore_messages=None, services=None, service_key=None):
         """Init the handler."""
         super().__init__()
+        self.addFilter(StatusFilter(allow, deny, ignore_messages))
 
+        self._stats = HandlerStats(stats_interval)
+        self._spooled = 0
         self.server = server
-        self.monitor = OP5Monitor(service, server, host, auth)
+        self.monitor = OP5Monitor(service, server, host, auth, pool_size=pool_size, timeout=timeout,
+                                  failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self.service_key = service_key
+        self._service_table = self._compile_services(services or {})
+        self._routes = {}
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._pending_lock = Lock()
+        self._flush_timer = None
+        self.spool = None
+        self.replay_interval = replay_interval
+        self._replayer = None
+        self._stop_replay = Event()
+        if spool_dir is not None:
+            self.spool = StatusSpool(spool_dir, spool_segment_size, spool_max_segments)
+            if self.spool:
+                self._start_replayer()
+
+    def handle(self, record):
+        """Count the record in, and handle it."""
+        self._stats.records_in += 1
+        self._stats.report(self, logger)
+        return super().handle(record)
+
+    def stats(self):
+        """Get the health statistics of the handler."""
+        stats = self._stats.as_dict()
+        stats["records_spooled"] = self._spooled
+        if self.monitor.breaker is not None:
+            stats["circuit"] = self.monitor.breaker.state
+        return stats
 
     def emit(self, record):
         """Emit a record."""
-        if record.levelno >= logging.ERROR:
-            status = 2
-        elif record.levelno >= logging.WARNING:
-            status = 1
-        elif record.levelno >= logging.INFO:
-            status = 0
-        else:
+        status = get_op5_status(record.levelno)
+        if status is None:
             return
         try:
-            self.monitor.send_message(status, self.format(record))
-        except gaierror:
-            sys.stderr.write("Can't reach %s !\n" % self.server)
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self._send_or_coalesce(status, msg, record)
+
+    def handle_event(self, event):
+        """Send the status of a status event of a fan-out handler.
+
+        The filters of the handler apply to the event as to a record.  See
+        :class:`pytroll_monitor.fanout.FanOutHandler`.
+        """
+        self._stats.records_in += 1
+        if not self.filter(event):
+            return
+        self.emit_event(event)
+
+    def emit_event(self, event):
+        """Send the status of a status event."""
+        if event.status is not None:
+            self._send_or_coalesce(event.status, event.msg, event)
+
+    def _compile_services(self, services):
+        """Compile the services into a table of logger names, most specific first."""
+        table = []
+        for name, target in services.items():
+            if isinstance(target, str):
+                target = {"service": target}
+            table.append((name, (target.get("host", self.monitor.monitor_host), target["service"])))
+        table.sort(key=lambda item: len(item[0]), reverse=True)
+        return table
+
+    def get_route(self, record):
+        """Get the host and service a record, or an event, is a status for."""
+        if self.service_key is not None:
+            service = getattr(record, self.service_key, None)
+            if service is not None:
+                return self.monitor.monitor_host, service
+        route = self._routes.get(record.name)
+        if route is None:
+            route = self._routes[record.name] = self._find_route(record.name)
+        return route
+
+    def _find_route(self, name):
+        """Find the route of the records of a logger in the service table."""
+        for prefix, route in self._service_table:
+            if name == prefix or name.startswith(prefix + "."):
+                return route
+        return self.monitor.monitor_host, self.monitor.monitor_service
+
+    def _send_or_coalesce(self, status, msg, record):
+        if self.flush_interval:
+            self._coalesce(status, msg, record)
+        else:
+            self.send_status(status, msg, record)
+
+    def handleError(self, record):
+        """Handle an error while sending the status of a record, or of an event."""
+        if isinstance(record, StatusEvent):
+            record = record.to_record()
+        super().handleError(record)
+
+    def send_status(self, status, msg, record):
+        """Send a status to the monitor server, for the service of the record."""
+        host, service = self.get_route(record)
+        start = time.perf_counter()
+        try:
+            self.monitor.send_message(status, msg, service=service, host=host)
+        except CircuitOpenError:
+            # The server is known to be down, fail fast and quietly
+            self._spool_or_drop(host, service, status, msg)
+        except (gaierror, RequestException) as err:
+            self._stats.failures += 1
+            if not _is_transient(err):
+                # Rejected by the server, sending it again would not help
+                self._stats.records_dropped += 1
+            elif self._spool_or_drop(host, service, status, msg):
+                return
+            if isinstance(err, gaierror):
+                sys.stderr.write("Can't reach %s !\n" % self.server)
             self.handleError(record)
         except Exception:
+            self._stats.failures += 1
+            self._stats.records_dropped += 1
             self.handleError(record)
+        else:
+            self._stats.send_time.add(time.perf_counter() - start)
+            self._stats.records_sent += 1
+            if self.spool:
+                self.spool.mark_delivered(host, service)
+
+    def _spool_or_drop(self, host, service, status, msg):
+        """Spool an undelivered status if possible, return True if it was spooled."""
+        if self.spool is None:
+            self._stats.records_dropped += 1
+            return False
+        self.spool.append(host, service, status, msg)
+        self._spooled += 1
+        self._start_replayer()
+        return True
+
+    def _start_replayer(self):
+        """Start replaying the spooled statuses in the background."""
+        with self._pending_lock:
+            if self._replayer is not None:
+                return
+            self._replayer = Thread(target=self._replay_loop, daemon=True)
+        self._replayer.start()
+
+    def _replay_loop(self):
+        """Replay the spool regularly, until the server takes the statuses.
+
+        The replays are reported on stderr rather than logged, as the report
+        would come back to this handler as a status, overwriting the
+        replayed one.
+        """
+        while not self._stop_replay.wait(self.replay_interval):
+            if not self.spool:
+                continue
+            try:
+                sent = self.spool.replay(self._send_spooled, _is_transient)
+            except Exception:
+                sys.stderr.write("Could not replay the spooled statuses\n")
+                traceback.print_exc(file=sys.stderr)
+                continue
+            if sent:
+                sys.stderr.write("Replayed %d spooled statuses to %s\n" % (sent, self.server))
+
+    def _send_spooled(self, host, service, status, msg):
+        self.monitor.send_message(status, msg, service=service, host=host)
+
+    def _coalesce(self, status, msg, record):
+        """Fold the status in the current window of its service, opening one if needed."""
+        route = self.get_route(record)
+        with self._pending_lock:
+            pending = self._pending.get(route)
+            if pending is None:
+                self._pending[route] = _PendingStatus(status, msg, record)
+            else:
+                pending.add(status, msg, record)
+            if self._flush_timer is None:
+                self._flush_timer = Timer(self.flush_interval, self._send_pending)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Flush the handler, sending the coalesced statuses if any."""
+        self._send_pending()
+
+    def _send_pending(self):
+        """Send the coalesced status of each service, if any."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            timer, self._flush_timer = self._flush_timer, None
+        if timer is not None:
+            timer.cancel()
+        for status in pending.values():
+            self.send_status(status.status, status.get_plugin_output(), status.record)
+
+    def close(self):
+        """Close the handler and its connections to the server."""
+        self.flush()
+        self._stop_replay.set()
+        if self._replayer is not None and self._replayer is not current_thread():
+            self._replayer.join()
+        if self.spool is not None:
+            self.spool.close()
+        self.monitor.close()
+        super().close()
+
+
+class _Stop:
+    """Tell the worker thread to stop."""
+
+    levelno = sys.maxsize
+
+
+_STOP = _Stop()
+_DROPPED = object()
+
+
+OVERFLOW_POLICIES = ("block", "drop-newest", "drop-oldest", "drop-lowest-level-first")
+
+
+class RecordQueue(Queue):
+    """A queue of records with a size limit and an overflow policy.
+
+    When the queue holds `maxsize` records, the `overflow` policy decides what
+    happens to a new one: "block" waits for room, "drop-newest" drops the new
+    record, "drop-oldest" drops the oldest queued record, and
+    "drop-lowest-level-first" drops the oldest queued record with the lowest
+    level, or the new one if its level is lower still.  Dropped records are
+    counted per level name.
+
+    With "drop-lowest-level-first", the queued records are also kept in a
+    queue per level, and a dropped record is only marked as such in the main
+    queue and skipped when getting it, so dropping costs O(1) too.
+    """
+
+    def __init__(self, maxsize=0, overflow="block"):
+        """Init the queue."""
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %r, should be one of %s"
+                             % (overflow, ", ".join(OVERFLOW_POLICIES)))
+        super().__init__(maxsize if overflow == "block" else 0)
+        self.limit = maxsize
+        self.overflow = overflow
+        self.dropped = Counter()
+        self.unreported = Counter()
+        self._levels = {} if overflow == "drop-lowest-level-first" else None
+        self._size = 0
+
+    def _qsize(self):
+        if self._levels is None:
+            return len(self.queue)
+        return self._size
+
+    def _put(self, item):
+        """Put the item, making room according to the overflow policy."""
+        if (self.overflow == "block" or not self.limit or self._qsize() < self.limit or
+                item is _STOP):
+            self._append(item)
+            return
+        if self.overflow == "drop-newest":
+            victim = item
+        elif self.overflow == "drop-oldest":
+            victim = self.queue.popleft()
+            self.queue.append(item)
+        else:
+            lowest = min(self._levels, default=None)
+            if lowest is not None and lowest <= _get_levelno(item):
+                entry = self._pop_level(lowest)
+                victim = entry[0]
+                entry[0] = _DROPPED
+                self._size -= 1
+                self._append(item)
+            else:
+                victim = item
+        # The put is accounted as an unfinished task, the drop compensates it
+        self.unfinished_tasks -= 1
+        levelname = logging.getLevelName(_get_levelno(victim))
+        self.dropped[levelname] += 1
+        self.unreported[levelname] += 1
+
+    def _append(self, item):
+        if self._levels is None:
+            self.queue.append(item)
+            return
+        entry = [item]
+        self.queue.append(entry)
+        if item is not _STOP:
+            self._levels.setdefault(_get_levelno(item), deque()).append(entry)
+        self._size += 1
+
+    def _get(self):
+        if self._levels is None:
+            return self.queue.popleft()
+        entry = self.queue.popleft()
+        while entry[0] is _DROPPED:
+            entry = self.queue.popleft()
+        item = entry[0]
+        if item is not _STOP:
+            self._pop_level(_get_levelno(item))
+        self._size -= 1
+        return item
+
+    def _pop_level(self, levelno):
+        """Pop the oldest entry of a level."""
+        entries = self._levels[levelno]
+        entry = entries.popleft()
+        if not entries:
+            del self._levels[levelno]
+        return entry
+
+    def pop_unreported(self):
+        """Get the counts of drops not reported yet, and reset them."""
+        with self.mutex:
+            unreported = dict(self.unreported)
+            self.unreported.clear()
+        return unreported
+
+
+def _get_levelno(item):
+    return item.levelno
 
 
 class AsyncHandler():
-    """Asynchronous logging handler."""
+    """Asynchronous logging handler.
+
+    The records are queued by the caller and emitted from `workers` worker
+    threads, each with its own queue.  Records with the same ordering key,
+    see :meth:`get_ordering_key`, go to the same worker, so they are emitted
+    in order.  The queues can be bounded with `max_queue_size` records each,
+    in which case `overflow` selects the policy for full queues, see
+    :class:`RecordQueue`.  Dropped records are reported with a warning once
+    their queue is drained, on stderr.
 
-    def __init__(self, *args, **kwargs):
-        """Init the asynchronous handler with a queue and a thread."""
+    The records are formatted by the caller into compact status events, see
+    :class:`StatusEvent`, so that the queues do not keep the arguments,
+    exceptions and stack frames of the records alive.  This is done by
+    :meth:`prepare`, and the events are handed to the `emit_event` method of
+    the handler on the worker thread by :meth:`dispatch`.
+
+    Flushing or closing the handler waits for the queued records to be
+    emitted, but no longer than `drain_timeout` seconds.  As for any handler,
+    this is done by :func:`logging.shutdown` at exit, flushing and then
+    closing the handler: when the flush times out and the workers are still
+    stuck, closing does not wait for more than what is left of the flush
+    deadline, so the exit waits at most `drain_timeout`.  Records emitted after
+    the handler is closed are emitted synchronously.
+    """
+
+    def __init__(self, *args, workers=1, max_queue_size=0, overflow="block", drain_timeout=5,
+                 **kwargs):
+        """Init the asynchronous handler with queues and threads."""
         super().__init__(*args, **kwargs)
-        self.__queue = Queue()
-        self.__thread = Thread(target=self.__loop)
-        self.__thread.daemon = True
-        self.__thread.start()
+        if workers < 1:
+            raise ValueError("At least one worker is needed, got %d" % workers)
+        self.drain_timeout = drain_timeout
+        self._closing = False
+        self._dispatched = 0
+        self._timed_out = None
+        self._queues = [RecordQueue(max_queue_size, overflow) for _ in range(workers)]
+        self._threads = []
+        self._thread_lock = Lock()
+
+    def get_ordering_key(self, record):
+        """Get the key of the records to emit in order."""
+        return None
+
+    def prepare(self, record):
+        """Make the status event to queue for a record, None to skip it."""
+        try:
+            return StatusEvent.from_record(record, self.format(record))
+        except Exception:
+            self.handleError(record)
+            return None
+
+    def dispatch(self, event):
+        """Emit a queued status event."""
+        self.emit_event(event)
 
     def emit(self, record):
         """Emit the record."""
-        self.__queue.put(record)
+        item = self.prepare(record)
+        if item is None:
+            return
+        if self._closing:
+            self.dispatch(item)
+            return
+        if not self._threads:
+            self._start_threads()
+        if len(self._queues) == 1:
+            queue = self._queues[0]
+        else:
+            queue = self._queues[hash(self.get_ordering_key(item)) % len(self._queues)]
+        queue.put(item)
+
+    def _start_threads(self):
+        """Start the worker threads, on the first record."""
+        with self._thread_lock:
+            if not self._threads:
+                threads = [Thread(target=self._loop, args=(queue, ), daemon=True)
+                           for queue in self._queues]
+                for thread in threads:
+                    thread.start()
+                self._threads = threads
+
+    def stats(self):
+        """Get the health statistics of the handler, including its queues."""
+        stats = super().stats()
+        stats["queue_depth"] = sum(queue.qsize() for queue in self._queues)
+        stats["records_dropped"] += sum(self.dropped_records().values())
+        return stats
+
+    def dropped_records(self):
+        """Get the number of records dropped so far, per level name."""
+        dropped = Counter()
+        for queue in self._queues:
+            with queue.mutex:
+                dropped.update(queue.dropped)
+        return dict(dropped)
+
+    def flush(self, timeout=None):
+        """Wait for the queued records to be emitted, then flush.
+
+        Wait at most `timeout` seconds, defaulting to `drain_timeout`.  Return
+        True if the queues were drained.  Once the handler is closing, the
+        queues are not waited for again, :meth:`close` having its own deadline.
+        """
+        if self._closing:
+            drained = not any(queue.unfinished_tasks for queue in self._queues)
+        else:
+            if timeout is None:
+                timeout = self.drain_timeout
+            deadline = time.monotonic() + timeout
+            drained = self._drain(deadline)
+            self._timed_out = None if drained else (deadline, self._dispatched)
+        super().flush()
+        return drained
 
-    def __loop(self):
-        """Loop over the records and emit."""
+    def close(self, timeout=None):
+        """Drain the queues, stop the worker threads and close the handler.
+
+        Wait at most `timeout` seconds, defaulting to `drain_timeout`, for the
+        queued records to be emitted.  If the previous flush timed out and the
+        workers have not emitted anything since, wait no longer than its
+        deadline.
+        """
+        if timeout is None:
+            timeout = self.drain_timeout
+        deadline = time.monotonic() + timeout
+        if self._timed_out is not None:
+            flush_deadline, dispatched = self._timed_out
+            if dispatched == self._dispatched:
+                deadline = min(deadline, flush_deadline)
+        if not self._closing and self._threads:
+            self._drain(deadline)
+            self._closing = True
+            stopping = []
+            for queue, thread in zip(self._queues, self._threads):
+                try:
+                    queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+                except Full:
+                    continue
+                stopping.append(thread)
+            for thread in stopping:
+                thread.join(max(deadline - time.monotonic(), 0))
+        self._closing = True
+        super().close()
+
+    def _drain(self, deadline):
+        """Wait until the queues are drained or the deadline is passed."""
+        if current_thread() in self._threads:
+            return not any(queue.unfinished_tasks for queue in self._queues)
+        drained = True
+        for queue in self._queues:
+            with queue.all_tasks_done:
+                drained &= queue.all_tasks_done.wait_for(
+                    lambda: not queue.unfinished_tasks,
+                    max(deadline - time.monotonic(), 0))
+        return drained
+
+    def _loop(self, queue):
+        """Loop over the items of a queue and dispatch them."""
         while True:
-            record = self.__queue.get()
-            super().emit(record)
+            item = queue.get()
+            if item is _STOP:
+                queue.task_done()
+                break
+            self.dispatch(item)
+            self._dispatched += 1
+            if queue.unreported and queue.empty():
+                self._report_dropped(queue)
+            queue.task_done()
+
+    def _report_dropped(self, queue):
+        """Report the records dropped while the queue was full."""
+        unreported = queue.pop_unreported()
+        if unreported:
+            msg = ("Monitoring queue overflowed, dropped %d records (%s)"
+                   % (sum(unreported.values()),
+                      ", ".join("%s: %d" % item for item in sorted(unreported.items()))))
+            # Not logged, as the warning would come back to this handler as a status
+            sys.stderr.write(msg + "\n")
 
 
 class AsyncOP5Handler(AsyncHandler, OP5Handler):
-    """Async version of the OP5Handler."""
+    """Async version of the OP5Handler.
+
+    With several `workers`, the statuses are sent concurrently while the
+    statuses of a given service are still sent in order.
+    """
+
+    def get_ordering_key(self, event):
+        """Get the host and service the event is a status for."""
+        return self.get_route(event)
+
+
+class AsyncioOP5Handler(AsyncOP5Handler):
+    """Asyncio version of the OP5Handler.
+
+    Records emitted from a running event loop are sent by tasks on that loop,
+    with at most `max_in_flight` requests at a time, so that the loop is never
+    blocked by the network.  The statuses of a service are sent one after the
+    other, in order, while those of different services are sent
+    concurrently.  Records emitted outside of an event loop are sent
+    from a worker thread as with the AsyncOP5Handler, the thread being started
+    on the first such record.  Await :meth:`aflush` before closing the handler
+    to wait for the statuses sent by tasks.
+    """
+
+    def __init__(self, *args, max_in_flight=DEFAULT_POOL_SIZE, **kwargs):
+        """Init the handler."""
+        super().__init__(*args, **kwargs)
+        self.max_in_flight = max_in_flight
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._tasks = set()
+        self._last_tasks = {}
+
+    def emit(self, record):
+        """Emit the record, from a task if an event loop is running."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            super().emit(record)
+            return
+        event = self.prepare(record)
+        if event is None or event.status is None:
+            return
+        if self.flush_interval:
+            self._coalesce(event.status, event.msg, event)
+            return
+        route = self.get_route(event)
+        previous = self._last_tasks.get(route)
+        if previous is not None and previous.get_loop() is not loop:
+            previous = None
+        task = loop.create_task(self._send_status_async(event.status, event.msg, event, previous))
+        self._tasks.add(task)
+        self._last_tasks[route] = task
+        task.add_done_callback(lambda task: self._forget_task(route, task))
+
+    def _forget_task(self, route, task):
+        self._tasks.discard(task)
+        if self._last_tasks.get(route) is task:
+            del self._last_tasks[route]
+
+    async def _send_status_async(self, status, msg, record, previous=None):
+        """Send a status from a task once the `previous` one of its service is sent.
+
+        The number of requests in flight is limited to `max_in_flight`.
+        """
+        if previous is not None:
+            await asyncio.wait([previous])
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        async with semaphore:
+            await asyncio.to_thread(self.send_status, status, msg, record)
+
+    def stats(self):
+        """Get the health statistics of the handler, including the tasks in flight."""
+        stats = super().stats()
+        stats["in_flight"] = len(self._tasks)
+        return stats
 
-    pass
+    async def aflush(self):
+        """Wait for the statuses sent by the tasks of the running loop."""
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._tasks if task.get_loop() is loop]
+        if tasks:
+            await asyncio.gather(*tasks)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Logger to export metrics for the node_exporter textfile collector.
+
+This module contains a logging handler counting the log records per logger
+and level, keeping track of the service status the same way as the checkmk
+handler, and of the time of the last nominal production.  These are written
+in OpenMetrics text format to a file that node_exporter's textfile collector
+picks up, at most every ``write_interval`` seconds.
+
+An example logging config illustrating how to use this::
+
+    handlers:
+      metrics:
+        (): pytroll_monitor.openmetrics_logger.OpenMetricsHandler
+        level: DEBUG
+        metrics_file: /var/lib/node_exporter/textfile_collector/pytroll.prom
+        write_interval: 15
+    root:
+      level: DEBUG
+      handlers:
+        - metrics
+"""
+
+import logging
+import threading
+import time
+
+from pytroll_monitor.checkmk_logger import DEFAULT_RULES, RuleSet, ServiceStatus, write_file_atomically
+from pytroll_monitor.stats import HandlerStats
+
+logger = logging.getLogger(__name__)
+
+
+class OpenMetricsHandler(logging.Handler):
+    """Handler exporting log record counts and the service status as metrics.
+
+    Emitting a record only updates counters in memory.  The metrics file is
+    replaced atomically, at most every `write_interval` seconds, and when the
+    handler is flushed or closed.  The status is decided by `rules`, see
+    :class:`pytroll_monitor.checkmk_logger.Rule`, a record matching a rule
+    with `refresh` set marking a nominal production.
+
+    The health of the handler is available from :meth:`stats`, the sent
+    records being the writes of the metrics file, and is logged every
+    `stats_interval` seconds if given.
+    """
+
+    def __init__(self, metrics_file, write_interval=15, rules=None, prefix="pytroll",
+                 stats_interval=None):
+        """Initialise the handler."""
+        super().__init__()
+        self._stats = HandlerStats(stats_interval)
+        self.metrics_file = metrics_file
+        self.write_interval = write_interval
+        if rules is None:
+            rules = DEFAULT_RULES
+        if isinstance(rules, str):
+            self.rules = RuleSet.from_yaml(rules)
+        elif isinstance(rules, RuleSet):
+            self.rules = rules
+        else:
+            self.rules = RuleSet(rules)
+        self.prefix = prefix
+        self.status = ServiceStatus.UNKNOWN
+        self.counts = {}
+        self.last_nominal = {}
+        self._last_write = None
+        self._write_timer = None
+        self.write_metrics_to_file()
+
+    def handle(self, record):
+        """Count the record in, and handle it."""
+        self._stats.records_in += 1
+        self._stats.report(self, logger)
+        return super().handle(record)
+
+    def stats(self):
+        """Get the health statistics of the handler."""
+        return self._stats.as_dict()
+
+    def emit(self, record):
+        """Count the record and update the status."""
+        key = (record.name, record.levelname)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        rule, _ = self.rules.match(record)
+        if rule is not None:
+            self.status = rule.status
+            if rule.refresh:
+                self.last_nominal[record.name] = record.created
+        self._schedule_write()
+
+    def _schedule_write(self):
+        """Write the metrics now, or once the write interval is over."""
+        if self._write_timer is not None:
+            return
+        delay = self.write_interval - (time.monotonic() - self._last_write)
+        if delay <= 0:
+            self.write_metrics_to_file()
+        else:
+            self._write_timer = threading.Timer(delay, self.flush)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def flush(self):
+        """Write the metrics to the file."""
+        self.acquire()
+        try:
+            if self._write_timer is not None:
+                self._write_timer.cancel()
+                self._write_timer = None
+            self.write_metrics_to_file()
+        finally:
+            self.release()
+
+    def close(self):
+        """Write the metrics a last time and close the handler."""
+        self.flush()
+        super().close()
+
+    def get_metrics(self):
+        """Get the metrics in OpenMetrics text format."""
+        prefix = self.prefix
+        lines = [f"# HELP {prefix}_log_records Log records emitted, per logger and level.",
+                 f"# TYPE {prefix}_log_records counter"]
+        for (name, level), count in sorted(self.counts.items()):
+            lines.append(f'{prefix}_log_records_total{{logger="{_escape(name)}",level="{level}"}} {count:d}')
+        lines += [f"# HELP {prefix}_status Service status, 0 = OK, 1 = WARN, 2 = CRIT, 3 = UNKNOWN.",
+                  f"# TYPE {prefix}_status gauge",
+                  f"{prefix}_status {self.status:d}",
+                  f"# HELP {prefix}_last_nominal_production_timestamp_seconds "
+                  "Time of the last nominal production, per logger.",
+                  f"# TYPE {prefix}_last_nominal_production_timestamp_seconds gauge"]
+        for name, created in sorted(self.last_nominal.items()):
+            lines.append(f'{prefix}_last_nominal_production_timestamp_seconds{{logger="{_escape(name)}"}} '
+                         f"{created:.3f}")
+        lines.append("# EOF\n")
+        return "\n".join(lines)
+
+    def write_metrics_to_file(self):
+        """Update the metrics in the metrics file."""
+        start = time.perf_counter()
+        try:
+            write_file_atomically(self.metrics_file, self.get_metrics())
+        except OSError:
+            self._stats.failures += 1
+            raise
+        self._last_write = time.monotonic()
+        self._stats.send_time.add(time.perf_counter() - start)
+        self._stats.records_sent += 1
+
+
+def _escape(value):
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
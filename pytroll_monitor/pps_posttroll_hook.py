@@ -26,10 +26,14 @@ Posttroll and sends messages notifying the completion of a PGE
 """
 
 import os
+import atexit
+import functools
 import logging
+import socket
 from posttroll.publisher import Publish
 from posttroll.message import Message
-from multiprocessing import Manager
+from pytroll_monitor.relay import send_to_relay
+from queue import Queue
 import threading
 from datetime import timedelta
 import time
@@ -39,6 +43,7 @@ LOG = logging.getLogger(__name__)
 VIIRS_TIME_THR1 = timedelta(seconds=81)
 VIIRS_TIME_THR2 = timedelta(seconds=87)
 WAIT_NSECS_PPS_PUBLISH = 1
+STOP_NSECS_PPS_PUBLISH = 10
 
 MODE = os.getenv("SMHI_MODE")
 if MODE is None:
@@ -81,10 +86,42 @@ class PPSPublisher(threading.Thread):
     def __init__(self, queue):
         threading.Thread.__init__(self)
         self.queue = queue
-
-    def stop(self):
-        """Stops the file publisher"""
+        self.queued = 0
+        self.sent = 0
+        self._sent_condition = threading.Condition()
+
+    def send(self, message):
+        """Queue an encoded message for publishing"""
+        with self._sent_condition:
+            self.queued += 1
+        self.queue.put(message)
+
+    def in_flight(self):
+        """Get the number of messages queued but not sent yet"""
+        return self.queued - self.sent
+
+    def wait_in_flight(self, max_in_flight, timeout=None):
+        """Wait until less than `max_in_flight` messages are queued but not sent
+
+        Return False if the publisher stopped, or if the timeout expired
+        before.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._sent_condition:
+            while self.in_flight() >= max_in_flight:
+                if not self.is_alive():
+                    return False
+                wait = 1 if deadline is None else min(deadline - time.monotonic(), 1)
+                if wait <= 0:
+                    return False
+                self._sent_condition.wait(wait)
+        return True
+
+    def stop(self, timeout=None):
+        """Stops the file publisher, once the queued messages are sent"""
         self.queue.put(None)
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
 
     def run(self):
 
@@ -95,13 +132,52 @@ class PPSPublisher(threading.Thread):
                 retv = self.queue.get()
 
                 if retv != None:
-                    LOG.info("Publish the message...")
+                    LOG.debug("Publish the message...")
                     publisher.send(retv)
-                    LOG.info("Message published!")
+                    LOG.debug("Message published!")
+                    with self._sent_condition:
+                        self.sent += 1
+                        self._sent_condition.notify_all()
                 else:
                     break
 
 
+_PUBLISHER = None
+_PUBLISHER_PID = None
+_PUBLISHER_LOCK = threading.Lock()
+
+
+def get_publisher():
+    """Get the process-wide PPS publisher, starting it on first use.
+
+    The publisher is shared by all the PPSMessage instances of the process, so
+    the posttroll publisher is set up (and waits for subscribers) only once.
+    It is stopped at exit, after the pending messages have been sent.
+    """
+    global _PUBLISHER, _PUBLISHER_PID
+
+    with _PUBLISHER_LOCK:
+        if (_PUBLISHER is None or _PUBLISHER_PID != os.getpid() or
+                not _PUBLISHER.is_alive()):
+            _PUBLISHER = PPSPublisher(Queue())
+            _PUBLISHER.daemon = True
+            _PUBLISHER.start()
+            _PUBLISHER_PID = os.getpid()
+            atexit.register(_PUBLISHER.stop, STOP_NSECS_PPS_PUBLISH)
+        return _PUBLISHER
+
+
+def stop_publisher(timeout=STOP_NSECS_PPS_PUBLISH):
+    """Stop the process-wide PPS publisher, if it is running"""
+    global _PUBLISHER
+
+    with _PUBLISHER_LOCK:
+        publisher, _PUBLISHER = _PUBLISHER, None
+    if publisher is not None and _PUBLISHER_PID == os.getpid():
+        atexit.unregister(publisher.stop)
+        publisher.stop(timeout)
+
+
 class PPSMessage(object):
 
     """A Posttroll message class to trigger the sending of a notifcation that a PPS PGE os ready
@@ -142,44 +218,85 @@ class PPSMessage(object):
             # Ok
             pubmsg = self.create_message("OK", mda)
 
-            manager = Manager()
-            publisher_q = manager.Queue()
-
-            pub_thread = PPSPublisher(publisher_q)
-            pub_thread.start()
             LOG.info("Sending: " + str(pubmsg))
-            publisher_q.put(pubmsg)
-            pub_thread.stop()
+            if not send_to_relay({'posttroll': pubmsg}):
+                get_publisher().send(pubmsg)
+
+    def publish_many(self, pairs, max_in_flight=1000, max_rate=None, progress=None,
+                     progress_every=1000):
+        """Publish the messages of many PGEs, as when reprocessing
+
+        The `pairs` of status and PPS metadata, from any iterable or
+        generator, are streamed through the process-wide publisher, with at
+        most `max_in_flight` messages queued but not sent yet, and at most
+        `max_rate` messages a second if given.  The PGEs that failed are
+        skipped.  Every `progress_every` pairs, and at the end, `progress` is
+        called with the counters if given.  Return the counters: the number
+        of messages published, of PGEs skipped, the elapsed time and the rate
+        of messages a second.
+        """
+        publisher = get_publisher()
+        counters = {'published': 0, 'skipped': 0, 'elapsed': 0., 'rate': 0.}
+        start = time.monotonic()
+
+        def update_counters():
+            counters['elapsed'] = time.monotonic() - start
+            if counters['elapsed'] > 0:
+                counters['rate'] = counters['published'] / counters['elapsed']
+            if progress is not None:
+                progress(dict(counters))
+
+        for number, (status, mda) in enumerate(pairs, 1):
+            if status != 0:
+                counters['skipped'] += 1
+            else:
+                pubmsg = self.create_message("OK", mda)
+                if max_rate:
+                    delay = start + counters['published'] / max_rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                if (publisher.in_flight() >= max_in_flight and
+                        not publisher.wait_in_flight(max_in_flight)):
+                    raise RuntimeError("The PPS publisher stopped")
+                publisher.send(pubmsg)
+                counters['published'] += 1
+            if number % progress_every == 0:
+                update_counters()
+
+        if not publisher.wait_in_flight(1):
+            raise RuntimeError("The PPS publisher stopped")
+        update_counters()
+        return counters
 
     def create_message(self, status, mda):
         """Create the posttroll message from the PPS metadata"""
 
-        import socket
-
-        servername = socket.gethostname()
+        servername = get_servername()
         LOG.debug("Servername = %s", str(servername))
 
-        to_send = {}
-        for key in mda:
-            # Disregard the PPS keyword "filename". We will use URI/UID instead - see below:
-            if key not in to_send and key != 'filename':
-                to_send[key] = mda[key]
-
-            if key == 'platform_name':
-                to_send[key] = PLATFORM_CONVERSION_PPS2OSCAR.get(mda[key], mda[key])
+        # Disregard the PPS keyword "filename". We will use URI/UID instead - see below:
+        to_send = {key: value for key, value in mda.items() if key != 'filename'}
+        if 'platform_name' in to_send:
+            to_send['platform_name'] = PLATFORM_CONVERSION_PPS2OSCAR.get(to_send['platform_name'],
+                                                                         to_send['platform_name'])
 
+        uri_prefix = 'ssh://' + servername
         if isinstance(mda['filename'], list):
+            cwd = os.getcwd()
             dataset = []
             for filename in mda['filename']:
-                uri = 'ssh://{server}{path}'.format(server=servername, path=os.path.abspath(filename))
-                uid = os.path.basename(filename)
-                dataset.append({'uri': uri, 'uid': uid})
+                directory, slash, uid = filename.rpartition('/')
+                if uid in ('', '.', '..'):
+                    path, uid = os.path.abspath(filename), os.path.basename(filename)
+                else:
+                    # Keep the slash, so the files right under / are told from relative ones
+                    path = _absdir(directory + slash, cwd) + uid
+                dataset.append({'uri': uri_prefix + path, 'uid': uid})
             to_send['dataset'] = dataset
         else:
             filename = mda['filename']
 
-            uri = 'ssh://{server}{path}'.format(server=servername, path=os.path.abspath(filename))
-            to_send['uri'] = uri
+            to_send['uri'] = uri_prefix + os.path.abspath(filename)
             if 'uid' not in to_send:
                 LOG.debug("Add uid as it was not included in the metadata from PPS")
                 LOG.debug("Filename = %s", filename)
@@ -188,25 +305,39 @@ class PPSMessage(object):
         to_send['data_processing_level'] = self.level
         to_send['format'] = self.output_format
         to_send['status'] = status
-        station = self.station
-
-        pps_product = PPS_PRODUCT_FILE_ID.get(mda.get('module', 'unknown'), 'UNKNOWN')
-        environment = MODE
 
-        if is_segment(mda):
-            topic = '/segment/'
-        else:
-            topic = '/'
-
-        pub_message = Message(topic + to_send['format'] + '/' +
-                              to_send['data_processing_level'] + '/' +
-                              pps_product + '/' +
-                              station + '/' + environment +
-                              '/polar/direct_readout/',
-                              "file", to_send).encode()
+        topic = get_topic(self.output_format, self.level, mda.get('module', 'unknown'),
+                          self.station, MODE, is_segment(mda))
+        pub_message = Message(topic, "file", to_send).encode()
         return pub_message
 
 
+@functools.cache
+def get_servername():
+    """Get the name of this server, looked up once per process"""
+    return socket.gethostname()
+
+
+@functools.lru_cache(maxsize=256)
+def get_topic(output_format, level, module, station, mode, segment):
+    """Get the posttroll topic of a PPS product"""
+    pps_product = PPS_PRODUCT_FILE_ID.get(module, 'UNKNOWN')
+    return ('/segment/' if segment else '/') + '/'.join([output_format, level, pps_product,
+                                                        station, mode,
+                                                        'polar/direct_readout/'])
+
+
+@functools.lru_cache(maxsize=1024)
+def _absdir(directory, cwd):
+    """Get the absolute path of a directory, ending with a slash
+
+    The files of a dataset usually share a few directories, so these are
+    normalised once rather than for each file.
+    """
+    path = os.path.normpath(os.path.join(cwd, directory))
+    return path if path.endswith('/') else path + '/'
+
+
 def is_segment(pps_info):
     """Determine if the scene is a 'segment' (that is a sensor data granule,
        e.g. 85 seconds of VIIRS)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A local relay daemon for the hooks run by short-lived processes.
+
+The PPS post hooks run in the PGE processes, which would otherwise import
+posttroll, start a publisher, wait for the subscribers to find it and tear it
+all down for every message.  The ``pytroll-monitor-relay`` daemon keeps one
+warm posttroll publisher and one OP5 session instead, and the hooks hand their
+payloads to it as datagrams on a Unix domain socket, which takes
+microseconds.  When no relay is listening, the hooks send directly.
+
+The relay is opt-in: the hooks only use it when the ``PYTROLL_MONITOR_RELAY``
+environment variable gives the path of its socket, and only if the socket
+belongs to the user running them.  The daemon holds its own OP5
+configuration, read from a yaml file::
+
+    server: http://myop5server.com/some/service
+    auth: [user, password]
+    timeout: 10
+
+so no credentials go through the socket.  The relay advertises the OP5
+server it sends to in a file next to its socket, and the hooks sending to
+another server, or to a relay without OP5 configuration, send directly.
+"""
+
+import argparse
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+from queue import Queue
+from threading import Thread
+
+LOG = logging.getLogger(__name__)
+
+RELAY_ENV = "PYTROLL_MONITOR_RELAY"
+OP5_SERVER_SUFFIX = ".op5"
+MAX_DATAGRAM_SIZE = 1 << 20
+
+_CLIENT = None
+_CLIENT_PID = None
+
+
+def get_relay_socket():
+    """Get the path of the relay socket, None if the relay is not used."""
+    return os.environ.get(RELAY_ENV) or None
+
+
+def send_to_relay(payload, socket_path=None):
+    """Hand a payload over to the relay, return False if no relay took it.
+
+    This never blocks: if the relay is not running, or is too far behind to
+    take the datagram, the caller is expected to send the payload itself.
+    A socket that is not owned by the current user is not used, and the
+    OP5 statuses are only handed to a relay sending to their server.
+    """
+    global _CLIENT, _CLIENT_PID
+
+    socket_path = socket_path or get_relay_socket()
+    if socket_path is None:
+        return False
+    try:
+        socket_stat = os.stat(socket_path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(socket_stat.st_mode) or socket_stat.st_uid != os.getuid():
+        LOG.warning("Not using the relay at %s, it is not a socket of the current user", socket_path)
+        return False
+    if "op5" in payload and payload["op5"].get("server") != _get_op5_server(socket_path):
+        return False
+    if _CLIENT is None or _CLIENT_PID != os.getpid():
+        _CLIENT = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        _CLIENT.setblocking(False)
+        _CLIENT_PID = os.getpid()
+    try:
+        _CLIENT.sendto(json.dumps(payload).encode(), socket_path)
+    except OSError as err:
+        LOG.debug("Relay at %s did not take the payload: %s", socket_path, err)
+        return False
+    return True
+
+
+def _get_op5_server(socket_path):
+    """Get the OP5 server a relay sends to, None if it sends to none."""
+    try:
+        with open(socket_path + OP5_SERVER_SUFFIX, encoding="utf-8") as fd:
+            if os.fstat(fd.fileno()).st_uid != os.getuid():
+                return None
+            return fd.read().strip() or None
+    except OSError:
+        return None
+
+
+def _is_listening(socket_path):
+    """Check if a relay is listening on a socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as probe:
+        probe.setblocking(False)
+        try:
+            probe.sendto(b"", socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        except BlockingIOError:
+            pass
+    return True
+
+
+class Relay(object):
+    """The relay daemon, forwarding the payloads of the hooks.
+
+    Two kinds of payloads are relayed: ``{"posttroll": <encoded message>}``
+    is published through the process-wide PPS publisher, and
+    ``{"op5": {...}}`` holding the server, host, service, status and message
+    of an :class:`OP5Monitor` status is sent to the OP5 server.  The server
+    and its credentials are configured in `op5`, with the `server`, `auth`
+    and `timeout` keys, and the statuses for other servers are not relayed.
+    The OP5 statuses are sent from a worker thread, so a slow server never
+    stops the relay from taking datagrams.
+    """
+
+    def __init__(self, socket_path=None, op5=None):
+        """Set up the relay, see :meth:`serve` to run it."""
+        self.socket_path = socket_path or get_relay_socket()
+        if self.socket_path is None:
+            raise ValueError("No relay socket given, and %s is not set" % RELAY_ENV)
+        self.op5 = op5
+        self.monitor = None
+        self.relayed = 0
+        self._sock = None
+        self._stopped = False
+        self._op5_queue = Queue()
+        self._op5_worker = None
+
+    def bind(self):
+        """Bind the relay socket, replacing a stale one.
+
+        Raise an OSError if another relay is listening on the socket, or if
+        the path is taken by something else than a socket.
+        """
+        if os.path.lexists(self.socket_path):
+            if not stat.S_ISSOCK(os.lstat(self.socket_path).st_mode):
+                raise FileExistsError(errno.EEXIST, "Not a socket", self.socket_path)
+            if _is_listening(self.socket_path):
+                raise OSError(errno.EADDRINUSE, "Another relay is listening", self.socket_path)
+            os.unlink(self.socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._advertise_op5_server()
+        self._op5_worker = Thread(target=self._send_op5_loop, daemon=True)
+        self._op5_worker.start()
+
+    def serve(self):
+        """Relay the payloads until stopped."""
+        if self._sock is None:
+            self.bind()
+        LOG.info("Relaying on %s", self.socket_path)
+        try:
+            while not self._stopped:
+                data = self._sock.recv(MAX_DATAGRAM_SIZE)
+                if not data:
+                    continue
+                try:
+                    self.relay(json.loads(data))
+                except Exception:
+                    LOG.exception("Could not relay %r", data[:200])
+        finally:
+            self._close()
+
+    def relay(self, payload):
+        """Forward a payload."""
+        LOG.debug("Relaying %s", payload)
+        if "posttroll" in payload:
+            from pytroll_monitor.pps_posttroll_hook import get_publisher
+            get_publisher().send(payload["posttroll"])
+        elif "op5" in payload:
+            server = payload["op5"].get("server")
+            if self.op5 is None or server != self.op5["server"]:
+                raise ValueError("Not configured to relay the OP5 statuses for %s" % server)
+            self._op5_queue.put(payload["op5"])
+        else:
+            raise ValueError("Unknown payload")
+        self.relayed += 1
+
+    def stop(self):
+        """Stop relaying, waking the relay up if needed."""
+        self._stopped = True
+        if self._sock is not None:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                    sock.sendto(b"", self.socket_path)
+            except OSError:
+                pass
+
+    def _close(self):
+        self._op5_queue.put(None)
+        self._op5_worker.join(10)
+        if self.monitor is not None:
+            self.monitor.close()
+        self._sock.close()
+        self._sock = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        _remove(self.socket_path + OP5_SERVER_SUFFIX)
+        try:
+            from pytroll_monitor.pps_posttroll_hook import stop_publisher
+        except ImportError:
+            return
+        stop_publisher()
+
+    def _advertise_op5_server(self):
+        """Tell the hooks which OP5 server the relay sends to, if any."""
+        marker = self.socket_path + OP5_SERVER_SUFFIX
+        _remove(marker)
+        if self.op5 is None:
+            return
+        fd = os.open(marker + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as fobj:
+            fobj.write(self.op5["server"])
+        os.replace(marker + ".tmp", marker)
+
+    def _send_op5_loop(self):
+        while True:
+            status = self._op5_queue.get()
+            if status is None:
+                return
+            try:
+                self._get_monitor().send_message(status["status"], status["msg"],
+                                                 service=status["service"], host=status["host"])
+            except Exception as err:
+                LOG.warning("Could not send the status of %s to %s: %s",
+                            status.get("service"), self.op5["server"], err)
+
+    def _get_monitor(self):
+        """Get the warm monitor of the OP5 server."""
+        if self.monitor is None:
+            from pytroll_monitor.monitor_hook import DEFAULT_TIMEOUT, OP5Monitor
+            self.monitor = OP5Monitor(None, self.op5["server"], None, monitor_auth=self.op5.get("auth"),
+                                      timeout=self.op5.get("timeout", DEFAULT_TIMEOUT))
+        return self.monitor
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def main(args=None):
+    """Run the relay daemon."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-s", "--socket", default=get_relay_socket(),
+                        help="path of the relay socket, default $%s" % RELAY_ENV)
+    parser.add_argument("-c", "--op5-config",
+                        help="yaml file with the server, auth and timeout of the OP5 server to relay to")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log each relayed payload")
+    args = parser.parse_args(args)
+    if args.socket is None:
+        parser.error("no relay socket given, and $%s is not set" % RELAY_ENV)
+    op5 = None
+    if args.op5_config is not None:
+        import yaml
+        with open(args.op5_config) as fd:
+            op5 = yaml.safe_load(fd)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="[%(asctime)s %(levelname)-8s %(name)s] %(message)s")
+    relay = Relay(args.socket, op5=op5)
+    signal.signal(signal.SIGTERM, lambda signum, frame: relay.stop())
+    try:
+        relay.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
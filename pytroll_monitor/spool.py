@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""An on-disk spool for the statuses that could not be delivered."""
+
+import json
+import os
+import sys
+import threading
+import time
+
+SEGMENT_PREFIX = "statuses-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class StatusSpool:
+    """An append-only log of undelivered statuses, split in segments.
+
+    The statuses are appended as json lines to the current segment file in
+    `directory`.  A new segment is started when the current one reaches
+    `segment_size` bytes, and the oldest segments are deleted when there are
+    more than `max_segments` of them.  The spool survives restarts, the
+    segments found in the directory being replayed too.
+
+    Replaying sends only the latest status of each service, and skips the
+    services that were delivered directly since their status was spooled.
+    """
+
+    def __init__(self, directory, segment_size=1024 * 1024, max_segments=10):
+        """Open the spool, creating the directory if needed."""
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments = sorted(int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                                for filename in os.listdir(directory)
+                                if filename.startswith(SEGMENT_PREFIX) and
+                                filename.endswith(SEGMENT_SUFFIX))
+        self._fd = None
+        self._size = 0
+
+    def __bool__(self):
+        """Check if there are statuses to replay."""
+        return bool(self._segments)
+
+    def _get_filename(self, segment):
+        return os.path.join(self.directory, "%s%08d%s" % (SEGMENT_PREFIX, segment, SEGMENT_SUFFIX))
+
+    def append(self, host, service, status, msg):
+        """Spool an undelivered status."""
+        self._write({"host": host, "service": service, "status": status, "msg": msg,
+                     "time": time.time()})
+
+    def mark_delivered(self, host, service):
+        """Record that a newer status of a service was delivered."""
+        self._write({"host": host, "service": service, "delivered": True})
+
+    def _write(self, entry):
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            if self._fd is None or self._size >= self.segment_size:
+                self._start_segment()
+            os.write(self._fd, line)
+            self._size += len(line)
+
+    def _start_segment(self):
+        """Start a new segment, dropping the oldest ones beyond the cap."""
+        self._close_segment()
+        segment = self._segments[-1] + 1 if self._segments else 0
+        self._fd = os.open(self._get_filename(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        self._segments.append(segment)
+        while len(self._segments) > self.max_segments:
+            oldest = self._segments.pop(0)
+            _report("Spool of undelivered statuses is full, dropping %s" % self._get_filename(oldest))
+            _remove(self._get_filename(oldest))
+
+    def _close_segment(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def replay(self, send, is_transient=None):
+        """Send the latest status of each spooled service.
+
+        `send` is called with the host, service, status and message of each
+        status to replay.  A status failing to be sent is kept for the next
+        replay if `is_transient` returns True for the error, by default for
+        any error, and is dropped otherwise, eg when the server rejects it.
+        The other statuses are replayed all the same.  The replayed segments
+        are deleted once done.  Return the number of statuses sent.
+        """
+        with self._lock:
+            segments = list(self._segments)
+            self._close_segment()
+        latest = {}
+        for segment in segments:
+            try:
+                with open(self._get_filename(segment), encoding="utf-8") as fd:
+                    for line in fd:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        latest[(entry["host"], entry["service"])] = entry
+            except FileNotFoundError:
+                continue
+        sent = 0
+        kept = []
+        for (host, service), entry in latest.items():
+            if entry.get("delivered"):
+                continue
+            try:
+                send(host, service, entry["status"], entry["msg"])
+            except Exception as err:
+                if is_transient is None or is_transient(err):
+                    kept.append(entry)
+                else:
+                    _report("Dropping the spooled status of %s on %s, it was rejected: %s"
+                            % (service, host, err))
+                continue
+            sent += 1
+        with self._lock:
+            for segment in segments:
+                if segment in self._segments:
+                    self._segments.remove(segment)
+                _remove(self._get_filename(segment))
+            if kept:
+                # Keep the failed statuses in the last replayed segment, so the
+                # statuses spooled meanwhile, in later segments, still win
+                segment = segments[-1]
+                with open(self._get_filename(segment), "w", encoding="utf-8") as fd:
+                    fd.writelines(json.dumps(entry) + "\n" for entry in kept)
+                self._segments.append(segment)
+                self._segments.sort()
+        return sent
+
+    def close(self):
+        """Close the current segment."""
+        with self._lock:
+            self._close_segment()
+
+
+def _report(msg):
+    """Report a problem of the spool.
+
+    Not logged, as the spool serves a logging handler which would take the
+    warning as a status.
+    """
+    sys.stderr.write(msg + "\n")
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Lightweight statistics on the health of the monitoring handlers."""
+
+import threading
+import time
+
+# The reports being logged by the current thread, which the handlers get too
+_reporting = threading.local()
+
+
+class LatencyHistogram:
+    """A histogram of durations, in power-of-two buckets of microseconds.
+
+    Adding a duration costs a few integer operations.  Percentiles are
+    estimated as the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self, nbuckets=32):
+        """Set up an empty histogram, the last bucket holding everything above."""
+        self.counts = [0] * nbuckets
+        self.count = 0
+        self.total = 0.
+
+    def add(self, seconds):
+        """Add a duration."""
+        index = min(int(seconds * 1e6).bit_length(), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, percent):
+        """Estimate a percentile of the durations, in seconds, None if there are none."""
+        if not self.count:
+            return None
+        target = percent / 100 * self.count
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= target:
+                return (1 << index) / 1e6
+        return None
+
+    def mean(self):
+        """Get the mean duration, in seconds, None if there are none."""
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+class HandlerStats:
+    """Counters and send times of a handler.
+
+    The counters are plain integers updated without locking, so they are
+    cheap to update, and exact unless several threads update them at once.
+    If `report_interval` is given, :meth:`report_due` tells when the stats
+    should be reported, at most every `report_interval` seconds, and
+    :meth:`report` logs them.
+    """
+
+    def __init__(self, report_interval=None):
+        """Set up zeroed counters."""
+        if report_interval is not None and report_interval <= 0:
+            raise ValueError("The report interval must be positive, not %r" % (report_interval, ))
+        self.records_in = 0
+        self.records_sent = 0
+        self.records_dropped = 0
+        self.failures = 0
+        self.send_time = LatencyHistogram()
+        self.report_interval = report_interval
+        self._last_report = time.monotonic()
+
+    def report_due(self):
+        """Check if the stats should be reported now."""
+        if self.report_interval is None:
+            return False
+        now = time.monotonic()
+        if now - self._last_report < self.report_interval:
+            return False
+        self._last_report = now
+        return True
+
+    def report(self, handler, log):
+        """Log the stats of a handler at DEBUG level with `log`, if they are due.
+
+        The report reaches the handlers of `log` too, so the handler may be
+        reporting from within its own report: nothing is reported then.
+        """
+        if getattr(_reporting, "active", False) or not self.report_due():
+            return
+        _reporting.active = True
+        try:
+            log.debug("%s health: %s", type(handler).__name__, handler.stats())
+        finally:
+            _reporting.active = False
+
+    def as_dict(self):
+        """Get the stats as a dictionary."""
+        return {"records_in": self.records_in,
+                "records_sent": self.records_sent,
+                "records_dropped": self.records_dropped,
+                "failures": self.failures,
+                "send_time_mean": self.send_time.mean(),
+                "send_time_p50": self.send_time.percentile(50),
+                "send_time_p99": self.send_time.percentile(99)}
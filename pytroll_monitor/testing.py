@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2026
+
+# Author(s):
+
+#   Pytroll developers
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tools to test the monitoring without a real OP5 server.
+
+The :class:`OP5StubServer` is a local stand-in for the OP5 server, taking
+the statuses posted by :meth:`pytroll_monitor.monitor_hook.OP5Monitor.send_message`
+and injecting latency, server errors and connection resets as configured.
+DNS failures are injected on the client side with :func:`fail_dns`::
+
+    with OP5StubServer(latency=.05, error_rate=.1) as server:
+        handler = AsyncOP5Handler("service", server.url, "host")
+        ...
+        with fail_dns(server.hostname, rate=.5) as dns:
+            ...
+    print(server.statuses, dns.failures)
+"""
+
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OP5_PATH = "/api/command/PROCESS_SERVICE_CHECK_RESULT"
+
+
+class _OP5StubHandler(BaseHTTPRequestHandler):
+    """Take the statuses posted to the OP5 server, or fail as configured."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        """Record the posted status and the connection it came through."""
+        server = self.server
+        length = int(self.headers["Content-Length"])
+        body = self.rfile.read(length)
+        if server.latency:
+            time.sleep(server.latency)
+        fault = server.draw_fault()
+        if fault == "reset":
+            # Close with a RST rather than a FIN, as a crashing peer would
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            server.resets += 1
+            return
+        if fault == "error":
+            server.errors += 1
+            self._respond(503, b"Service Unavailable")
+            return
+        status = json.loads(body)
+        server.statuses.append(status)
+        server.received.append((time.perf_counter(), status))
+        server.connections.add(self.client_address)
+        self._respond(200, b"OK")
+
+    def _respond(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Keep quiet."""
+
+
+class OP5StubServer(ThreadingHTTPServer):
+    """A local stand-in for the OP5 server.
+
+    Every request waits `latency` seconds, then fails with a 503 error with
+    the probability `error_rate`, or has its connection reset with the
+    probability `reset_rate`.  The statuses taken are kept in `statuses`,
+    in `received` along with the `time.perf_counter` time they were received
+    at, and the client addresses they came from in `connections`.  The fault
+    settings can be changed while the server runs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0, error_rate=0, reset_rate=0, seed=None):
+        """Bind the server, see :meth:`start` to run it."""
+        super().__init__(address, _OP5StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.statuses = []
+        self.received = []
+        self.connections = set()
+        self.errors = 0
+        self.resets = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def hostname(self):
+        """Get the host name of the server."""
+        return self.server_address[0]
+
+    @property
+    def url(self):
+        """Get the url to post the statuses to."""
+        return "http://%s:%d%s" % (self.hostname, self.server_port, OP5_PATH)
+
+    def draw_fault(self):
+        """Draw the fault to inject in a request, None if it should succeed."""
+        if not (self.error_rate or self.reset_rate):
+            return None
+        with self._random_lock:
+            draw = self._random.random()
+        if draw < self.reset_rate:
+            return "reset"
+        if draw < self.reset_rate + self.error_rate:
+            return "error"
+        return None
+
+    def start(self):
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, args=(.05, ), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the server."""
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        """Start the server."""
+        return self.start()
+
+    def __exit__(self, *exc):
+        """Stop the server."""
+        self.stop()
+
+
+@contextmanager
+def fail_dns(hostname, rate=1., seed=None):
+    """Make the requests to `hostname` fail as if it could not be resolved, with the probability `rate`.
+
+    The fault is drawn for every request, as if each request resolved the
+    name, rather than only when the pooled session opens a new connection.
+    The failed requests raise a ConnectionError caused by a gaierror, as
+    requests does, and are counted in the `failures` attribute of the object
+    returned.
+    """
+    send = HTTPAdapter.send
+    draws = random.Random(seed)
+    draws_lock = threading.Lock()
+    dns = SimpleNamespace(failures=0)
+
+    def failing_send(adapter, request, *args, **kwargs):
+        if urlsplit(request.url).hostname == hostname:
+            with draws_lock:
+                failing = draws.random() < rate
+                dns.failures += failing
+            if failing:
+                error = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+                raise requests.ConnectionError(error, request=request)
+        return send(adapter, request, *args, **kwargs)
+
+    with mock.patch.object(HTTPAdapter, "send", failing_send):
+        yield dns
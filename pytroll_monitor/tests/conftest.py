@@ -0,0 +1,11 @@
+"""Fixtures for the pytroll-monitor tests."""
+import pytest
+
+from pytroll_monitor.testing import OP5StubServer
+
+
+@pytest.fixture
+def op5_server():
+    """Run a local stand-in for the OP5 server."""
+    with OP5StubServer() as server:
+        yield server
@@ -0,0 +1,98 @@
+"""Tests for the fan-out handler."""
+import logging
+import os
+
+from pytroll_monitor.fanout import AsyncFanOutHandler, FanOutHandler
+
+
+class _CountingFormatter(logging.Formatter):
+    """Count the formatted records."""
+
+    count = 0
+
+    def format(self, record):
+        """Format and count."""
+        self.count += 1
+        return super().format(record)
+
+
+class _RecordingBackend:
+    """Keep the events."""
+
+    def __init__(self):
+        self.events = []
+        self.closed = False
+
+    def handle_event(self, event):
+        self.events.append(event)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_async_fanout_handler(op5_server, tmp_path):
+    """Test formatting once and feeding several backends from one worker."""
+    status_file = tmp_path / "status"
+    recording = _RecordingBackend()
+    handler = AsyncFanOutHandler(backends=[recording],
+                                 op5={"service": "service", "server": op5_server.url, "host": "host"},
+                                 checkmk={"status_file": os.fspath(status_file), "service_key": "product"})
+    formatter = _CountingFormatter("%(levelname)s %(message)s")
+    handler.setFormatter(formatter)
+    handler.setLevel(logging.INFO)
+    log = logging.getLogger("pytroll.test.fanout")
+    log.setLevel(logging.DEBUG)
+    log.addHandler(handler)
+    try:
+        log.debug("Not for the backends")
+        log.warning("Missing channel %s", "I04", extra={"product": "true_color"})
+        log.info("All 3 files produced nominally in 0:00:02", extra={"product": "true_color"})
+        log.error("Could not save", exc_info=ValueError("disk full"))
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    assert formatter.count == 3
+    assert len(handler._threads) == 1
+    assert [status["plugin_output"] for status in op5_server.statuses] == [
+        "WARNING Missing channel I04",
+        "INFO All 3 files produced nominally in 0:00:02",
+        "ERROR Could not save\nValueError: disk full"]
+    assert status_file.read_text(encoding="ascii").split("\n") == [
+        '2 "Pytroll status report" warnings=0|errors=1|files=0 Pytroll lives!',
+        '0 "Pytroll status report true_color" warnings=1|errors=0|files=3 Pytroll lives!']
+    event = recording.events[0]
+    assert (event.levelno, event.status, event.message, event.product) == (
+        logging.WARNING, 1, "Missing channel I04", "true_color")
+    assert recording.closed
+    assert handler.stats()["records_sent"] == 3
+
+
+def test_fanout_handler_isolates_backends(capsys):
+    """Test that a failing backend does not keep the others from the event."""
+    class FailingBackend(_RecordingBackend):
+        def handle_event(self, event):
+            raise RuntimeError("broken backend")
+
+    recording = _RecordingBackend()
+    handler = FanOutHandler(backends=[FailingBackend(), recording])
+    handler.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "failed %s", "args": ("twice",)}))
+
+    assert [event.msg for event in recording.events] == ["failed twice"]
+    assert "RuntimeError: broken backend" in capsys.readouterr().err
+    assert handler.stats()["failures"] == 1
+
+
+def test_fanout_handler_applies_op5_filters(op5_server):
+    """Test that the status filter of the OP5 backend applies to the fanned out events."""
+    handler = FanOutHandler(op5={"service": "service", "server": op5_server.url, "host": "host",
+                                 "deny": ["satpy"], "ignore_messages": ["^Retrying"]})
+    for name, msg in [("satpy.readers", "Missing segment"), ("trollflow2", "Retrying upload"),
+                      ("trollflow2", "Upload failed")]:
+        handler.handle(logging.makeLogRecord({"name": name, "levelno": logging.ERROR, "msg": msg}))
+    handler.close()
+
+    assert [status["plugin_output"] for status in op5_server.statuses] == ["Upload failed"]
@@ -1,6 +1,8 @@
 """Tests for custom logging handlers."""
 import os
 import logging
+import time
+from types import SimpleNamespace
 
 
 def test_checkmk_handler(tmp_path):
@@ -59,3 +61,294 @@ def test_checkmk_handler(tmp_path):
 
     finally:
         logger.removeHandler(ch)
+
+
+def test_checkmk_handler_throttles_refresh(tmp_path, monkeypatch):
+    """Test that an unchanged status is not rewritten too often."""
+    from pytroll_monitor import checkmk_logger
+    from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+
+    f = tmp_path / "status"
+    writes = []
+    write_file_atomically = checkmk_logger.write_file_atomically
+
+    def count_writes(filename, contents):
+        writes.append(contents)
+        write_file_atomically(filename, contents)
+
+    monkeypatch.setattr(checkmk_logger, "write_file_atomically", count_writes)
+    ch = Trollflow2CheckMKHandler(os.fspath(f), min_refresh_interval=3600)
+    nominal = logging.makeLogRecord({"levelno": logging.INFO,
+                                     "msg": "All 2 files produced nominally in 0:00:01"})
+    ch.handle(nominal)
+    ch.handle(nominal)
+    ch.handle(nominal)
+    assert [line[0] for line in writes] == ["3", "0"]
+
+    ch.min_refresh_interval = 0
+    ch.handle(nominal)
+    assert [line[0] for line in writes] == ["3", "0", "0"]
+    assert os.listdir(tmp_path) == ["status"]
+    assert f.read_text(encoding="ascii").startswith("0 ")
+
+
+def test_checkmk_handler_per_service(tmp_path):
+    """Test reporting a status per product, with performance data."""
+    from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+
+    f = tmp_path / "status"
+    ch = Trollflow2CheckMKHandler(os.fspath(f), service_key="product")
+    assert f.read_text(encoding="ascii") == '3 "Pytroll status report" warnings=0|errors=0|files=0 Pytroll lives!'
+
+    def log(level, msg, **extra):
+        ch.handle(logging.makeLogRecord(dict(levelno=level, msg=msg, **extra)))
+
+    log(logging.INFO, "All %d files produced nominally in %s", args=(3, "0:00:04"), product="cloudtype")
+    log(logging.WARNING, "Missing channel", product="true_color")
+    log(logging.INFO, "All 2 files produced nominally in 0:00:01", product="true_color")
+    log(logging.ERROR, "Could not save", product="cloudtype")
+    log(logging.ERROR, "Could not save again", product="cloudtype")
+    log(logging.DEBUG, "Nothing to see")
+    # The counts alone are written at most every min_refresh_interval
+    assert "errors=1" in f.read_text(encoding="ascii")
+    ch.flush()
+
+    assert f.read_text(encoding="ascii").split("\n") == [
+        '2 "Pytroll status report cloudtype" warnings=0|errors=2|files=3 Pytroll lives!',
+        '0 "Pytroll status report true_color" warnings=1|errors=0|files=2 Pytroll lives!']
+
+    log(logging.ERROR, "Disk full")
+    assert f.read_text(encoding="ascii").split("\n")[0] == (
+        '2 "Pytroll status report" warnings=0|errors=1|files=0 Pytroll lives!')
+
+    ch.min_refresh_interval = 0
+    log(logging.ERROR, "Disk still full")
+    assert f.read_text(encoding="ascii").split("\n")[0] == (
+        '2 "Pytroll status report" warnings=0|errors=2|files=0 Pytroll lives!')
+    ch.close()
+
+
+def test_checkmk_rules(tmp_path):
+    """Test configuring the status transitions with rules from yaml."""
+    from pytroll_monitor.checkmk_logger import RuleSet, ServiceStatus, Trollflow2CheckMKHandler
+
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text("""
+- logger: satpy.readers
+  min_level: WARNING
+  status: OK
+- min_level: ERROR
+  status: CRIT
+- max_level: INFO
+  logger: [trollflow2, pytroll]
+  message: "^Segment \\\\d+ missing"
+  status: WARN
+- max_level: INFO
+  message: "produced nominally"
+  status: OK
+  refresh: true
+  count_files: true
+""")
+    rules = RuleSet.from_yaml(os.fspath(rules_file))
+
+    def match(level, name, msg):
+        rule, _ = rules.match(logging.makeLogRecord({"levelno": level, "name": name, "msg": msg}))
+        return None if rule is None else rule.status
+
+    assert match(logging.ERROR, "satpy.readers.seviri", "Bad line") == ServiceStatus.OK
+    assert match(logging.ERROR, "satpy.writers", "Bad line") == ServiceStatus.CRIT
+    assert match(logging.WARNING, "satpy.writers", "Odd") is None
+    assert match(logging.INFO, "trollflow2.launcher", "Segment 3 missing") == ServiceStatus.WARN
+    assert match(logging.INFO, "satpy.scene", "Segment 3 missing") is None
+    assert match(logging.INFO, "trollflow2.launcher", "Segment 3 missing, all produced nominally") == ServiceStatus.WARN
+    assert match(logging.DEBUG, "trollflow2.launcher", "All 5 files produced nominally") == ServiceStatus.OK
+    assert match(logging.DEBUG, "trollflow2.launcher", "Something else") is None
+
+    ch = Trollflow2CheckMKHandler(os.fspath(tmp_path / "status"), rules=os.fspath(rules_file))
+    ch.handle(logging.makeLogRecord({"levelno": logging.CRITICAL, "name": "satpy.readers.hrit", "msg": "Fine"}))
+    assert ch.status == ServiceStatus.OK
+    ch.handle(logging.makeLogRecord({"levelno": logging.CRITICAL, "name": "satpy", "msg": "Not fine"}))
+    assert ch.status == ServiceStatus.CRIT
+
+
+def test_checkmk_handler_window(tmp_path, monkeypatch):
+    """Test deriving the status from the error rate over a sliding window."""
+    from pytroll_monitor import checkmk_logger
+    from pytroll_monitor.checkmk_logger import ServiceStatus, Trollflow2CheckMKHandler
+
+    now = [1000.]
+    monkeypatch.setattr(checkmk_logger, "time", SimpleNamespace(monotonic=lambda: now[0],
+                                                                 perf_counter=time.perf_counter))
+    ch = Trollflow2CheckMKHandler(os.fspath(tmp_path / "status"), window_minutes=10,
+                                  warn_rate=.05, crit_rate=.5)
+
+    def log(level, count=1):
+        for _ in range(count):
+            ch.handle(logging.makeLogRecord({"levelno": level, "msg": "granule"}))
+
+    log(logging.DEBUG)
+    assert ch.status == ServiceStatus.UNKNOWN
+    log(logging.INFO, 99)
+    assert ch.status == ServiceStatus.OK
+    log(logging.ERROR)
+    assert ch.status == ServiceStatus.OK
+    log(logging.ERROR, 9)
+    assert ch.status == ServiceStatus.WARN
+    log(logging.CRITICAL, 100)
+    assert ch.status == ServiceStatus.CRIT
+
+    now[0] += 11 * 60
+    log(logging.INFO)
+    assert ch.status == ServiceStatus.OK
+    assert ch.services[None].errors == 110
+
+    log(logging.CRITICAL, 10)
+    assert ch.status == ServiceStatus.CRIT
+    now[0] += 11 * 60
+    ch.refresh_windows()
+    assert ch.status == ServiceStatus.UNKNOWN
+    assert (tmp_path / "status").read_text().startswith(str(int(ServiceStatus.UNKNOWN)))
+    ch.close()
+
+
+def _log_error_in_worker(status_file, shared_file, go):
+    """Report an error from a worker process, and wait before exiting."""
+    from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+
+    ch = Trollflow2CheckMKHandler(status_file, shared_file=shared_file)
+    ch.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "Worker failed"}))
+    assert ch._writer_thread is None
+    go.wait(10)
+
+
+def test_checkmk_handler_shared(tmp_path):
+    """Test that the statuses of several processes are aggregated."""
+    import multiprocessing
+
+    from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+
+    status_file = tmp_path / "status"
+    shared_file = os.fspath(tmp_path / "shared")
+    ch = Trollflow2CheckMKHandler(os.fspath(status_file), shared_file=shared_file, poll_interval=.01)
+    try:
+        assert status_file.read_text(encoding="ascii").startswith("3 ")
+
+        ctx = multiprocessing.get_context("fork")
+        go = ctx.Event()
+        worker = ctx.Process(target=_log_error_in_worker, args=(os.fspath(status_file), shared_file, go))
+        worker.start()
+        while ch.shared.generation == 0:
+            time.sleep(.01)
+
+        ch.handle(logging.makeLogRecord({"levelno": logging.INFO,
+                                         "msg": "All 3 files produced nominally in 0:00:01"}))
+        deadline = time.monotonic() + 5
+        while not status_file.read_text(encoding="ascii").startswith("2 ") and time.monotonic() < deadline:
+            time.sleep(.01)
+        assert status_file.read_text(encoding="ascii").startswith("2 ")
+
+        go.set()
+        worker.join()
+        assert worker.exitcode == 0
+        ch.write_status_to_file()
+        assert status_file.read_text(encoding="ascii").startswith("0 ")
+    finally:
+        ch.close()
+
+
+def test_openmetrics_handler(tmp_path):
+    """Test exporting the log counts and status as OpenMetrics."""
+    from pytroll_monitor.openmetrics_logger import OpenMetricsHandler
+
+    f = tmp_path / "pytroll.prom"
+    handler = OpenMetricsHandler(os.fspath(f), write_interval=3600)
+    assert "pytroll_status 3\n" in f.read_text(encoding="ascii")
+
+    logger = logging.getLogger("pytroll.test.metrics")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        logger.debug("Loading")
+        logger.warning("Odd")
+        logger.debug("Loading")
+        logger.info("All %d files produced nominally in %s", 4, "0:00:03")
+        assert "pytroll_status 3\n" in f.read_text(encoding="ascii")
+        handler.flush()
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    metrics = f.read_text(encoding="ascii")
+    assert 'pytroll_log_records_total{logger="pytroll.test.metrics",level="DEBUG"} 2\n' in metrics
+    assert 'pytroll_log_records_total{logger="pytroll.test.metrics",level="WARNING"} 1\n' in metrics
+    assert "pytroll_status 0\n" in metrics
+    assert 'pytroll_last_nominal_production_timestamp_seconds{logger="pytroll.test.metrics"}' in metrics
+    assert metrics.endswith("# EOF\n")
+
+
+def test_checkmk_handler_stats(tmp_path):
+    """Test the health statistics of the checkmk handler."""
+    from pytroll_monitor.checkmk_logger import Trollflow2CheckMKHandler
+
+    ch = Trollflow2CheckMKHandler(os.fspath(tmp_path / "status"), service_key="product")
+    ch.handle(logging.makeLogRecord({"levelno": logging.DEBUG, "msg": "quiet"}))
+    ch.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "failed", "product": "cloudtype"}))
+
+    stats = ch.stats()
+    assert stats["records_in"] == 2
+    assert stats["records_sent"] == 2
+    assert stats["failures"] == 0
+    assert stats["services"] == 2
+    assert stats["send_time_p50"] > 0
+
+
+def test_checkmk_handler_ignores_chatty_loggers(tmp_path):
+    """Test that loggers with nothing to report do not become services."""
+    from pytroll_monitor.checkmk_logger import ServiceStatus, Trollflow2CheckMKHandler
+
+    f = tmp_path / "status"
+    ch = Trollflow2CheckMKHandler(os.fspath(f), service_key="name",
+                                  rules=[{"min_level": "ERROR", "status": "CRIT"},
+                                         {"logger": "custom", "status": "UNKNOWN"}])
+
+    def log(name, level, msg):
+        ch.handle(logging.makeLogRecord({"name": name, "levelno": level, "msg": msg}))
+
+    log("satpy.readers.yaml_reader", logging.DEBUG, "Reading")
+    log("pyresample.kd_tree", logging.INFO, "Resampling")
+    log("custom", logging.INFO, "Still unknown")
+    assert set(ch.services) == {None, "custom"}
+    assert f.read_text(encoding="ascii") == '3 "Pytroll status report" warnings=0|errors=0|files=0 Pytroll lives!'
+
+    log("trollflow2.launcher", logging.ERROR, "Crashed")
+    assert ch.services["trollflow2.launcher"].status == ServiceStatus.CRIT
+    assert f.read_text(encoding="ascii") == (
+        '2 "Pytroll status report trollflow2.launcher" warnings=0|errors=1|files=0 Pytroll lives!')
+
+
+def test_checkmk_rules_are_checked_at_load_time():
+    """Test that an invalid pattern is rejected when loading, and the patterns are found as given."""
+    import pytest
+
+    from pytroll_monitor.checkmk_logger import RuleSet, ServiceStatus
+
+    with pytest.raises(ValueError, match="rule 1"):
+        RuleSet([{"min_level": "ERROR", "status": "CRIT"},
+                 {"message": "(files", "status": "WARN"}])
+
+    rules = RuleSet([{"logger": "satpy.writers", "message": "(?i)^all 0 files", "status": "WARN"},
+                     {"message": "Segment \\d+ missing", "status": "WARN"},
+                     {"message": "failed|aborted", "status": "CRIT"}])
+    assert [rule.literal for rule in rules.rules] == [None, "Segment ", None]
+
+    def match(name, msg):
+        rule, _ = rules.match(logging.makeLogRecord({"levelno": logging.INFO, "name": name, "msg": msg}))
+        return None if rule is None else rule.status
+
+    assert match("satpy.writers", "ALL 0 files produced") == ServiceStatus.WARN
+    assert match("satpy.writers.geotiff", "all 0 files produced") == ServiceStatus.WARN
+    assert match("satpy.writersfoo", "all 0 files produced") is None
+    assert match("trollflow2", "Got it: Segment 12 missing") == ServiceStatus.WARN
+    assert match("trollflow2", "Segment 12 missingno") == ServiceStatus.WARN
+    assert match("trollflow2", "Segment twelve missing") is None
+    assert match("trollflow2", "Upload aborted") == ServiceStatus.CRIT
@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import logging
 import logging.config
+import os
+import threading
+import time
+import weakref
+from types import SimpleNamespace
 
+import pytest
 import requests_mock
 import yaml
 
 from pytroll_monitor.monitor_hook import OP5Monitor
-from pytroll_monitor.op5_logger import OP5Handler  # noqa
+from pytroll_monitor.op5_logger import AsyncioOP5Handler, AsyncOP5Handler, OP5Handler  # noqa
 
 yaml_config = """version: 1
 disable_existing_loggers: false
@@ -73,8 +80,715 @@ class TestOp5Interfaces:
         log_dict = yaml.safe_load(yaml_config)
         logging.config.dictConfig(log_dict)
 
+        try:
+            with requests_mock.Mocker() as m:
+                m.post(self.server, text=self.response_text)
+                logger.warning(self.message)
+                assert m.last_request.json() == self.expected_json
+                assert m.last_request.headers["Authorization"] == self.expected_auth
+        finally:
+            for handler in logging.getLogger().handlers[:]:
+                logging.getLogger().removeHandler(handler)
+                handler.close()
+
+    def test_op5monitor_reuses_connection(self, op5_server):
+        """Test that consecutive statuses go through one kept-alive connection."""
+        op5m = OP5Monitor(self.service, op5_server.url, self.host)
+        try:
+            for _ in range(5):
+                op5m.send_message(self.status, self.message)
+        finally:
+            op5m.close()
+        assert op5_server.statuses == [self.expected_json] * 5
+        assert len(op5_server.connections) == 1
+
+    def test_op5monitor_session_after_setstate(self):
+        """Test that an unpickled monitor gets its own session."""
+        import pickle
+
+        op5m = OP5Monitor(self.service, self.server, self.host, self.auth, pool_size=2)
+        session = op5m.session
+        op5m2 = pickle.loads(pickle.dumps(op5m))
+        assert op5m2.pool_size == 2
+        assert op5m2.session is not session
+
         with requests_mock.Mocker() as m:
             m.post(self.server, text=self.response_text)
-            logger.warning(self.message)
-            assert m.last_request.json() == self.expected_json
+            op5m2.send_message(self.status, self.message)
             assert m.last_request.headers["Authorization"] == self.expected_auth
+
+    def test_op5monitor_session_after_fork(self, monkeypatch):
+        """Test that the session is recreated in a forked child."""
+        import os
+
+        op5m = OP5Monitor(self.service, self.server, self.host)
+        session = op5m.session
+        assert op5m.session is session
+        monkeypatch.setattr(os, "getpid", lambda: -1)
+        assert op5m.session is not session
+
+    def test_op5handler_coalescing(self):
+        """Test that the records within the flush interval are sent as one status."""
+        handler = OP5Handler(self.service, self.server, self.host, self.auth, flush_interval=60)
+        logger = logging.getLogger("test_coalescing")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            with requests_mock.Mocker() as m:
+                m.post(self.server, text=self.response_text)
+                logger.info("Starting")
+                logger.error("First failure")
+                logger.error("Second failure")
+                logger.warning("Something odd")
+                logger.debug("Not a status")
+                assert not m.called
+                handler.flush()
+                assert m.call_count == 1
+                assert m.last_request.json()["status_code"] == 2
+                assert m.last_request.json()["plugin_output"] == "Second failure (+3 suppressed)"
+                handler.flush()
+                assert m.call_count == 1
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+    def test_op5handler_coalescing_timer(self):
+        """Test that the coalesced status is sent when the interval is over."""
+        import time
+
+        handler = OP5Handler(self.service, self.server, self.host, flush_interval=.05)
+        record = logging.makeLogRecord({"levelno": logging.WARNING, "msg": self.message})
+        with requests_mock.Mocker() as m:
+            m.post(self.server, text=self.response_text)
+            handler.handle(record)
+            time.sleep(.5)
+            assert m.call_count == 1
+            assert m.last_request.json()["plugin_output"] == self.message
+        handler.close()
+
+
+def _block_sending(handler):
+    """Make the handler's sends wait for a gate, and collect the sent messages."""
+    gate = threading.Event()
+    sent = []
+
+    def send_message(status, msg, service=None, host=None):
+        gate.wait()
+        sent.append(msg)
+
+    handler.monitor.send_message = send_message
+    return gate, sent
+
+
+@pytest.mark.parametrize(("overflow", "expected_sent", "expected_dropped"),
+                         [("drop-newest", ["0", "1", "2"], {"ERROR": 1}),
+                          ("drop-oldest", ["0", "2", "3"], {"WARNING": 1}),
+                          ("drop-lowest-level-first", ["0", "1", "3"], {"INFO": 1})])
+def test_async_handler_overflow(overflow, expected_sent, expected_dropped, capsys):
+    """Test the overflow policies of a full queue."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host",
+                              max_queue_size=2, overflow=overflow)
+    gate, sent = _block_sending(handler)
+    levels = [logging.INFO, logging.WARNING, logging.INFO, logging.ERROR]
+    records = [logging.makeLogRecord({"levelno": level, "msg": str(i)}) for i, level in enumerate(levels)]
+
+    handler.emit(records[0])
+    while not handler._queues[0].empty():
+        time.sleep(.001)
+    for record in records[1:]:
+        handler.emit(record)
+    assert handler.dropped_records() == expected_dropped
+
+    gate.set()
+    handler._queues[0].join()
+    assert sent == expected_sent
+    assert "dropped 1 records" in capsys.readouterr().err
+
+
+def test_record_queue_drops_lowest_level_first():
+    """Test that the oldest record of the lowest level is dropped, the others keeping their order."""
+    from pytroll_monitor.op5_logger import RecordQueue
+
+    queue = RecordQueue(4, "drop-lowest-level-first")
+    records = [SimpleNamespace(levelno=level, msg=str(i)) for i, level in
+               enumerate([logging.WARNING, logging.INFO, logging.ERROR, logging.INFO,
+                          logging.WARNING, logging.ERROR, logging.DEBUG])]
+    for record in records:
+        queue.put(record)
+    assert queue.qsize() == 4
+    assert queue.dropped == {"INFO": 2, "DEBUG": 1}
+    assert [queue.get().msg for _ in range(4)] == ["0", "2", "4", "5"]
+    assert queue.empty()
+
+
+
+def test_async_handler_unknown_overflow():
+    """Test that an unknown overflow policy is refused."""
+    with pytest.raises(ValueError):
+        AsyncOP5Handler("service", "http://op5.invalid", "host", overflow="drop-everything")
+
+
+def test_async_handler_close_drains_queue():
+    """Test that closing the handler emits the queued records and stops the thread."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host")
+    gate, sent = _block_sending(handler)
+    for i in range(3):
+        handler.emit(logging.makeLogRecord({"levelno": logging.CRITICAL, "msg": str(i)}))
+    threading.Timer(.05, gate.set).start()
+    handler.close()
+    assert sent == ["0", "1", "2"]
+    assert not any(thread.is_alive() for thread in handler._threads)
+
+    handler.emit(logging.makeLogRecord({"levelno": logging.CRITICAL, "msg": "late"}))
+    assert sent[-1] == "late"
+
+
+def test_async_handler_flush_deadline():
+    """Test that flushing gives up at the deadline when the server hangs."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host", drain_timeout=.05)
+    gate, sent = _block_sending(handler)
+    handler.emit(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "stuck"}))
+    start = time.monotonic()
+    assert handler.flush() is False
+    assert time.monotonic() - start < 1
+    gate.set()
+    assert handler.flush(timeout=5) is True
+    assert sent == ["stuck"]
+    handler.close()
+
+
+def test_async_handler_close_deadline():
+    """Test that closing waits for a hung server only once."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host", drain_timeout=.2)
+    gate, sent = _block_sending(handler)
+    handler.emit(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "stuck"}))
+    start = time.monotonic()
+    handler.close()
+    assert time.monotonic() - start < .35
+    gate.set()
+
+
+def test_async_handler_shutdown_deadline():
+    """Test that logging.shutdown, flushing then closing, waits for a hung server only once."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host", drain_timeout=.2)
+    gate, sent = _block_sending(handler)
+    handler.emit(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "stuck"}))
+    start = time.monotonic()
+    logging.shutdown([weakref.ref(handler)])
+    assert time.monotonic() - start < .35
+    gate.set()
+
+
+def test_asyncio_handler_does_not_block_the_loop(op5_server):
+    """Test that sending statuses from an event loop never stalls it."""
+    op5_server.latency = .2
+    handler = AsyncioOP5Handler("service", op5_server.url, "host", max_in_flight=2, service_key="product")
+
+    async def run():
+        gaps = []
+
+        async def tick():
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(.02)
+        start = time.monotonic()
+        for i in range(4):
+            handler.emit(logging.makeLogRecord({"levelno": logging.WARNING, "msg": str(i),
+                                                "product": "ct" if i % 2 else "cma"}))
+        assert time.monotonic() - start < .05
+        await handler.aflush()
+        elapsed = time.monotonic() - start
+        ticker.cancel()
+        return gaps, elapsed
+
+    gaps, elapsed = asyncio.run(run())
+    handler.close()
+    assert max(gaps) < .1
+    assert .35 < elapsed < .8
+    for product, outputs in [("cma", ["0", "2"]), ("ct", ["1", "3"])]:
+        assert [status["plugin_output"] for status in op5_server.statuses
+                if status["service_description"] == product] == outputs
+    assert not handler._threads
+
+
+def test_asyncio_handler_keeps_the_order_of_a_service():
+    """Test that a slow status is not overtaken by the later statuses of its service."""
+    handler = AsyncioOP5Handler("service", "http://myop5server.com/some/service", "host")
+    sent = []
+
+    def send_status(status, msg, record):
+        if msg == "OK first":
+            time.sleep(.1)
+        sent.append(msg)
+
+    handler.send_status = send_status
+
+    async def run():
+        for level, msg in [(logging.INFO, "OK first"), (logging.ERROR, "CRIT first"),
+                           (logging.INFO, "OK later")]:
+            handler.emit(logging.makeLogRecord({"levelno": level, "msg": msg}))
+        await handler.aflush()
+
+    asyncio.run(run())
+    handler.close()
+    assert sent == ["OK first", "CRIT first", "OK later"]
+    assert not handler._last_tasks
+
+
+def test_asyncio_handler_without_loop(op5_server):
+    """Test that the asyncio handler falls back to a thread outside of a loop."""
+    handler = AsyncioOP5Handler("service", op5_server.url, "host")
+    handler.emit(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "no loop"}))
+    handler.close()
+    assert op5_server.statuses[0]["plugin_output"] == "no loop"
+    assert op5_server.statuses[0]["status_code"] == 2
+
+
+class _PerLoggerOP5Handler(AsyncOP5Handler):
+    """Consider each logger as a service of its own, one per worker."""
+
+    def get_ordering_key(self, record):
+        return record.service
+
+
+def _send_per_logger(op5_server, workers):
+    """Send statuses for four services, and return the time it took."""
+    handler = _PerLoggerOP5Handler("service", op5_server.url, "host", workers=workers, pool_size=workers)
+    start = time.monotonic()
+    for i in range(8):
+        handler.emit(logging.makeLogRecord({"levelno": logging.WARNING, "service": i % 4,
+                                            "msg": str(i)}))
+    assert handler.flush(timeout=10)
+    elapsed = time.monotonic() - start
+    handler.close()
+    return elapsed
+
+
+def test_async_handler_workers(op5_server):
+    """Test that concurrent workers keep the order of each service's statuses."""
+    op5_server.latency = .05
+    serial = _send_per_logger(op5_server, workers=1)
+    del op5_server.statuses[:]
+    concurrent = _send_per_logger(op5_server, workers=4)
+    assert concurrent < serial / 2
+
+    outputs = [status["plugin_output"] for status in op5_server.statuses]
+    for service in range(4):
+        assert outputs.index(str(service)) < outputs.index(str(service + 4))
+
+
+def test_async_handler_needs_a_worker():
+    """Test that the handler refuses to run without workers."""
+    with pytest.raises(ValueError):
+        AsyncOP5Handler("service", "http://op5.invalid", "host", workers=0)
+
+
+def test_op5handler_spool(tmp_path):
+    """Test that undelivered statuses are spooled and the latest one replayed after a restart."""
+    import requests
+
+    spool_dir = tmp_path / "spool"
+    server = "http://myop5server.com/some/service"
+    handler = OP5Handler("service", server, "host", spool_dir=str(spool_dir), replay_interval=3600)
+    with requests_mock.Mocker() as m:
+        m.post(server, exc=requests.ConnectionError)
+        for level, msg in [(logging.ERROR, "first"), (logging.WARNING, "second")]:
+            handler.handle(logging.makeLogRecord({"levelno": level, "msg": msg}))
+    handler.close()
+    assert len(list(spool_dir.iterdir())) == 1
+
+    handler = OP5Handler("service", server, "host", spool_dir=str(spool_dir), replay_interval=.01)
+    try:
+        with requests_mock.Mocker() as m:
+            m.post(server, text="OK")
+            deadline = time.monotonic() + 5
+            while list(spool_dir.iterdir()) and time.monotonic() < deadline:
+                time.sleep(.01)
+            assert m.call_count == 1
+            assert m.last_request.json()["plugin_output"] == "second"
+            assert m.last_request.json()["status_code"] == 1
+    finally:
+        handler.close()
+    assert not list(spool_dir.iterdir())
+
+
+def test_spool_skips_delivered_services(tmp_path):
+    """Test that a service delivered since it was spooled is not replayed."""
+    from pytroll_monitor.spool import StatusSpool
+
+    spool = StatusSpool(str(tmp_path), segment_size=100, max_segments=3)
+    for i in range(5):
+        spool.append("host", "old", 2, "failure %d" % i)
+    spool.append("host", "new", 2, "failure")
+    spool.mark_delivered("host", "new")
+    assert len(list(tmp_path.iterdir())) == 3
+
+    sent = []
+    assert spool.replay(lambda *status: sent.append(status)) == 1
+    assert sent == [("host", "old", 2, "failure 4")]
+    assert not spool
+    assert not list(tmp_path.iterdir())
+
+
+def test_op5monitor_circuit_breaker(monkeypatch):
+    """Test that sending fails fast while the server is down, and recovers."""
+    import requests
+
+    from pytroll_monitor import monitor_hook
+    from pytroll_monitor.monitor_hook import CircuitOpenError
+
+    now = [100.]
+    monkeypatch.setattr(monitor_hook, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    server = "http://myop5server.com/some/service"
+    op5m = OP5Monitor("service", server, "host", timeout=[1, 2], failure_threshold=2, reset_timeout=10)
+    with requests_mock.Mocker() as m:
+        m.post(server, status_code=503)
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                op5m.send_message(0, "down")
+        assert op5m.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            op5m.send_message(0, "down")
+        assert m.call_count == 2
+
+        now[0] += 10
+        assert op5m.breaker.state == "half-open"
+        with pytest.raises(requests.HTTPError):
+            op5m.send_message(0, "still down")
+        assert op5m.breaker.state == "open"
+
+        now[0] += 10
+        m.post(server, exc=ValueError)
+        with pytest.raises(ValueError):
+            op5m.send_message(0, "probe failing on the way")
+        m.post(server, text="OK")
+        op5m.send_message(0, "up again")
+        assert op5m.breaker.state == "closed"
+        assert m.call_count == 5
+        assert m.last_request.timeout == (1, 2)
+
+
+def test_op5handler_fails_fast_when_circuit_is_open(capsys):
+    """Test that the handler does not report errors while the circuit is open."""
+    import requests
+
+    server = "http://myop5server.com/some/service"
+    handler = OP5Handler("service", server, "host", failure_threshold=1, reset_timeout=3600)
+    record = logging.makeLogRecord({"levelno": logging.ERROR, "msg": "failure"})
+    with requests_mock.Mocker() as m:
+        m.post(server, exc=requests.ConnectTimeout)
+        handler.handle(record)
+        assert "Traceback" in capsys.readouterr().err
+        handler.handle(record)
+        handler.handle(record)
+        assert m.call_count == 1
+        assert capsys.readouterr().err == ""
+    handler.close()
+
+
+def test_op5handler_stats(caplog):
+    """Test the health statistics of the handler."""
+    import requests
+
+    server = "http://myop5server.com/some/service"
+    handler = OP5Handler("service", server, "host", failure_threshold=None, stats_interval=60)
+    handler.handleError = lambda record: None
+    with requests_mock.Mocker() as m:
+        m.post(server, text="OK")
+        handler.handle(logging.makeLogRecord({"levelno": logging.WARNING, "msg": "odd"}))
+        handler.handle(logging.makeLogRecord({"levelno": logging.DEBUG, "msg": "quiet"}))
+        m.post(server, exc=requests.ConnectTimeout)
+        handler._stats._last_report -= 60
+        with caplog.at_level(logging.DEBUG, logger="pytroll_monitor.op5_logger"):
+            handler.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "down"}))
+    handler.close()
+
+    stats = handler.stats()
+    assert stats["records_in"] == 3
+    assert stats["records_sent"] == 1
+    assert stats["failures"] == 1
+    assert stats["records_dropped"] == 1
+    assert stats["records_spooled"] == 0
+    assert 0 < stats["send_time_mean"] <= stats["send_time_p99"]
+    assert "OP5Handler health: {'records_in': 3" in caplog.text
+
+
+def test_op5handler_stats_report_is_not_a_status(caplog):
+    """Test that a handler getting its own health report neither recurses nor sends it."""
+    server = "http://myop5server.com/some/service"
+    with pytest.raises(ValueError):
+        OP5Handler("service", server, "host", stats_interval=0)
+
+    handler = OP5Handler("service", server, "host", stats_interval=60)
+    package_logger = logging.getLogger("pytroll_monitor")
+    package_logger.addHandler(handler)
+    try:
+        with requests_mock.Mocker() as m:
+            m.post(server, text="OK")
+            handler._stats._last_report -= 60
+            with caplog.at_level(logging.DEBUG, logger="pytroll_monitor.op5_logger"):
+                handler.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "down"}))
+    finally:
+        package_logger.removeHandler(handler)
+        handler.close()
+    assert m.call_count == 1
+    assert m.last_request.json()["status_code"] == 2
+    assert caplog.text.count("OP5Handler health") == 1
+
+
+def test_async_handler_stats():
+    """Test that the async handler reports its queue."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host",
+                              max_queue_size=1, overflow="drop-newest")
+    gate, sent = _block_sending(handler)
+    record = logging.makeLogRecord({"levelno": logging.ERROR, "msg": "failure"})
+    handler.handle(record)
+    while not handler._queues[0].empty():
+        time.sleep(.001)
+    handler.handle(record)
+    handler.handle(record)
+
+    stats = handler.stats()
+    assert stats["records_in"] == 3
+    assert stats["queue_depth"] == 1
+    assert stats["records_dropped"] == 1
+    gate.set()
+    handler.close()
+    assert handler.stats()["records_sent"] == len(sent) == 2
+
+
+def _make_failure_record(number):
+    """Make an error record with a traceback whose frame holds some data."""
+    import sys
+
+    payload = [float(i) for i in range(1000)]  # noqa: F841, kept alive by the traceback
+    try:
+        raise ValueError("granule %d is broken" % number)
+    except ValueError:
+        return logging.makeLogRecord({"levelno": logging.ERROR, "levelname": "ERROR",
+                                      "msg": "Processing granule %d failed", "args": (number, ),
+                                      "exc_info": sys.exc_info()})
+
+
+def _get_memory_per_item(queue_item, count=200):
+    """Get the memory allocated per item queued by `queue_item`."""
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for number in range(count):
+            queue_item(_make_failure_record(number))
+        gc.collect()
+        return (tracemalloc.get_traced_memory()[0] - before) / count
+    finally:
+        tracemalloc.stop()
+
+
+def test_async_handler_queues_compact_events():
+    """Test that the queued status events are much smaller than the records."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host")
+    gate, sent = _block_sending(handler)
+    records = []
+    try:
+        record_size = _get_memory_per_item(records.append)
+        event_size = _get_memory_per_item(handler.handle)
+        assert handler._queues[0].qsize() >= 199
+        assert event_size * 10 < record_size
+    finally:
+        gate.set()
+        handler.close()
+    assert sent[0].startswith("Processing granule 0 failed\nTraceback")
+
+
+def test_async_handler_filters_before_queueing():
+    """Test that the records not worth a status are never queued."""
+    handler = AsyncOP5Handler("service", "http://op5.invalid", "host",
+                              allow=["trollflow2", "satpy"], deny=["satpy.readers", "trollflow2.plugins.foo"],
+                              ignore_messages=["^Heartbeat", "retrying$"])
+    gate, sent = _block_sending(handler)
+    prepare = handler.prepare
+    prepared = []
+    handler.prepare = lambda record: prepared.append(record.msg) or prepare(record)
+
+    def log(name, msg, level=logging.WARNING):
+        handler.handle(logging.makeLogRecord({"name": name, "levelno": level, "msg": msg}))
+
+    try:
+        log("trollflow2.launcher", "debugging", logging.DEBUG)
+        log("trollflow2.launcher", "Heartbeat 42")
+        log("trollflow2.launcher", "Connection lost, retrying")
+        log("trollflow2x", "not a child")
+        log("posttroll", "not allowed")
+        log("satpy.readers.seviri", "denied")
+        log("satpy.readers", "denied too")
+        log("trollflow2.plugins.foobar", "not a child of the denied one")
+        log("satpy", "allowed")
+        log("trollflow2.launcher", "Connection lost, retrying now")
+    finally:
+        gate.set()
+        handler.close()
+    assert prepared == sent == ["not a child of the denied one", "allowed", "Connection lost, retrying now"]
+
+
+def test_status_filter_most_specific_wins():
+    """Test that an allowed child of a denied logger passes."""
+    from pytroll_monitor.op5_logger import StatusFilter
+
+    status_filter = StatusFilter(allow=["satpy.readers.seviri"], deny=["satpy"])
+
+    def passes(name):
+        return status_filter.filter(logging.makeLogRecord({"name": name, "levelno": logging.ERROR}))
+
+    assert passes("satpy.readers.seviri.l1b")
+    assert not passes("satpy.readers")
+    assert not passes("satpy")
+    assert not passes("pyresample")
+
+
+def test_async_handler_routes_services(op5_server):
+    """Test sending the statuses of several services through one handler."""
+    handler = AsyncOP5Handler("default_service", op5_server.url, "host", flush_interval=60,
+                              services={"trollflow2": "trollflow2",
+                                        "trollflow2.plugins": {"service": "plugins", "host": "other_host"},
+                                        "satpy": {"service": "satpy"}},
+                              service_key="product")
+
+    def log(name, level, msg, **extra):
+        handler.handle(logging.makeLogRecord(dict(name=name, levelno=level, msg=msg, **extra)))
+
+    log("trollflow2.launcher", logging.INFO, "started")
+    log("trollflow2.launcher", logging.ERROR, "crashed")
+    log("trollflow2.plugins.save", logging.WARNING, "slow disk")
+    log("satpy.readers", logging.INFO, "read")
+    log("pyresample", logging.ERROR, "no area")
+    log("trollflow2.launcher", logging.WARNING, "cloudtype late", product="cloudtype")
+    handler.close()
+
+    statuses = {(status["host_name"], status["service_description"]): (status["status_code"],
+                                                                        status["plugin_output"])
+                for status in op5_server.statuses}
+    assert statuses == {("host", "trollflow2"): (2, "crashed (+1 suppressed)"),
+                        ("other_host", "plugins"): (1, "slow disk"),
+                        ("host", "satpy"): (0, "read"),
+                        ("host", "default_service"): (2, "no area"),
+                        ("host", "cloudtype"): (1, "cloudtype late")}
+    assert len(op5_server.statuses) == 5
+    assert len(op5_server.connections) == 1
+    assert len(handler._threads) == 1
+
+
+@pytest.mark.parametrize("fault", ["error", "reset", "dns"])
+def test_op5handler_survives_faults(op5_server, fault):
+    """Test that the handler counts the injected faults and recovers."""
+    from pytroll_monitor.testing import fail_dns
+
+    handler = OP5Handler("service", op5_server.url, "host", failure_threshold=None)
+    handler.handleError = lambda record: None
+
+    def log(msg):
+        handler.handle(logging.makeLogRecord({"levelno": logging.WARNING, "msg": msg}))
+
+    if fault == "dns":
+        log("first")
+        with fail_dns(op5_server.hostname) as dns:
+            log("lost")
+        assert dns.failures == 1
+    else:
+        log("first")
+        setattr(op5_server, fault + "_rate", 1)
+        log("lost")
+        setattr(op5_server, fault + "_rate", 0)
+    log("delivered")
+    handler.close()
+
+    assert [status["plugin_output"] for status in op5_server.statuses] == ["first", "delivered"]
+    stats = handler.stats()
+    assert (stats["failures"], stats["records_dropped"], stats["records_sent"]) == (1, 1, 2)
+
+
+def test_op5handler_does_not_spool_rejected_statuses(tmp_path):
+    """Test that the statuses rejected by the server are dropped rather than spooled."""
+    spool_dir = tmp_path / "spool"
+    server = "http://myop5server.com/some/service"
+    handler = OP5Handler("service", server, "host", spool_dir=str(spool_dir), replay_interval=3600)
+    errors = []
+    handler.handleError = errors.append
+    try:
+        with requests_mock.Mocker() as m:
+            m.post(server, status_code=400)
+            handler.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "rejected"}))
+            m.post(server, status_code=503)
+            handler.handle(logging.makeLogRecord({"levelno": logging.ERROR, "msg": "unavailable"}))
+        stats = handler.stats()
+    finally:
+        handler.close()
+    assert [record.msg for record in errors] == ["rejected"]
+    assert stats["records_dropped"] == 1
+    assert stats["records_spooled"] == 1
+
+
+def test_spool_replays_past_rejected_statuses(tmp_path):
+    """Test that a rejected status is dropped, a failing one kept, and the others replayed."""
+    from pytroll_monitor.spool import StatusSpool
+
+    class Rejected(Exception):
+        pass
+
+    spool = StatusSpool(str(tmp_path))
+    for service in ["rejected", "failing", "fine"]:
+        spool.append("host", service, 2, "failure")
+
+    sent = []
+
+    def send(host, service, status, msg):
+        if service == "rejected":
+            raise Rejected()
+        if service == "failing":
+            raise ConnectionError()
+        sent.append(service)
+
+    assert spool.replay(send, lambda err: not isinstance(err, Rejected)) == 1
+    assert sent == ["fine"]
+    spool.append("host", "failing", 0, "recovered")
+
+    sent = []
+    assert spool.replay(lambda host, service, status, msg: sent.append((service, msg))) == 1
+    assert sent == [("failing", "recovered")]
+    assert not spool
+
+
+def test_op5handler_replay_reports_are_not_statuses(tmp_path, capsys):
+    """Test that replaying the spool does not send its own reports as statuses."""
+    import requests
+
+    server = "http://myop5server.com/some/service"
+    handler = OP5Handler("service", server, "host", spool_dir=os.fspath(tmp_path), replay_interval=.01)
+    root = logging.getLogger()
+    level = root.level
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+    try:
+        with requests_mock.Mocker() as m:
+            m.post(server, exc=requests.ConnectionError)
+            logging.getLogger("pge").error("PGE crashed")
+            m.post(server, text="OK")
+            deadline = time.monotonic() + 5
+            while handler.spool and time.monotonic() < deadline:
+                time.sleep(.01)
+            time.sleep(.05)
+            outputs = [request.json()["plugin_output"] for request in m.request_history]
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+        handler.close()
+    assert outputs == ["PGE crashed", "PGE crashed"]
+    assert "Replayed 1 spooled statuses" in capsys.readouterr().err
@@ -0,0 +1,123 @@
+"""Tests for the PPS posttroll post hook."""
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("posttroll")
+
+from pytroll_monitor import pps_posttroll_hook  # noqa: E402
+from pytroll_monitor.pps_posttroll_hook import PPSMessage  # noqa: E402
+
+
+@pytest.fixture
+def publish(monkeypatch):
+    """Replace the posttroll publishing context with a mock."""
+    monkeypatch.setattr(pps_posttroll_hook, "WAIT_NSECS_PPS_PUBLISH", 0)
+    monkeypatch.setenv("PYTROLL_MONITOR_RELAY", "")
+    publish = mock.MagicMock()
+    monkeypatch.setattr(pps_posttroll_hook, "Publish", publish)
+    yield publish
+    pps_posttroll_hook.stop_publisher()
+
+
+@pytest.fixture
+def pps_message():
+    """Create a PPS message hook the way it is loaded from yaml."""
+    message = PPSMessage.__new__(PPSMessage)
+    message.__setstate__({"station": "norrkoping",
+                          "posttroll_topic": "PPS",
+                          "output_format": "CF",
+                          "level": "2"})
+    return message
+
+
+@pytest.fixture
+def mda():
+    """Create PPS metadata for a PGE."""
+    start_time = datetime(2026, 10, 18, 12, 0)
+    return {"module": "ppsCmask",
+            "platform_name": "noaa20",
+            "sensor": "viirs",
+            "start_time": start_time,
+            "end_time": start_time + timedelta(seconds=85),
+            "filename": "/data/pps/S_NWC_CMA_noaa20_12345.nc"}
+
+
+def test_create_message(pps_message, mda):
+    """Test creating the posttroll message from the PPS metadata."""
+    from posttroll.message import Message
+
+    msg = Message.decode(pps_message.create_message("OK", mda))
+    assert msg.subject == "/segment/CF/2/CMA/norrkoping/offline/polar/direct_readout/"
+    assert msg.data["platform_name"] == "NOAA-20"
+    assert msg.data["uid"] == "S_NWC_CMA_noaa20_12345.nc"
+    assert msg.data["uri"].endswith("/data/pps/S_NWC_CMA_noaa20_12345.nc")
+    assert "filename" not in msg.data
+
+
+def test_publisher_is_reused(publish, pps_message, mda):
+    """Test that consecutive calls share one long-lived publisher."""
+    pps_message(0, mda)
+    pps_message(0, mda)
+    publisher = pps_posttroll_hook.get_publisher()
+    pps_posttroll_hook.stop_publisher()
+
+    publish.assert_called_once_with("PPS", 0)
+    assert not publisher.is_alive()
+    assert publish.return_value.__enter__.return_value.send.call_count == 2
+
+
+def test_failed_pge_is_not_published(publish, pps_message, mda):
+    """Test that no message is published when the PGE failed."""
+    pps_message(1, mda)
+    pps_posttroll_hook.stop_publisher()
+    publish.assert_not_called()
+
+
+def test_create_message_dataset(pps_message, mda, monkeypatch, tmp_path):
+    """Test creating the posttroll message for a multi-file dataset."""
+    import os
+    import socket
+
+    from posttroll.message import Message
+
+    monkeypatch.chdir(tmp_path)
+    filenames = ["/data/pps/../pps/S_NWC_CT_1.nc", "S_NWC_CT_2.nc", "sub/./S_NWC_CT_3.nc", "/x.nc"]
+    mda.update(filename=filenames, end_time=mda["start_time"] + timedelta(minutes=10), module="ppsCtype")
+
+    msg = Message.decode(pps_message.create_message("OK", mda))
+    assert msg.subject == "/CF/2/CT/norrkoping/offline/polar/direct_readout/"
+    assert msg.data["dataset"] == [{"uri": "ssh://" + socket.gethostname() + os.path.abspath(filename),
+                                    "uid": os.path.basename(filename)}
+                                   for filename in filenames]
+    assert "uri" not in msg.data
+
+
+def test_publish_many(publish, pps_message, mda):
+    """Test streaming many messages with bounded buffering and a rate cap."""
+    in_flight = []
+    publisher = pps_posttroll_hook.get_publisher()
+
+    def send(message):
+        in_flight.append(publisher.in_flight())
+        time.sleep(.001)
+
+    publish.return_value.__enter__.return_value.send.side_effect = send
+    progress = []
+
+    def pairs():
+        for number in range(60):
+            yield (1 if number % 3 == 0 else 0), dict(mda, filename="/data/pps/S_NWC_CMA_%d.nc" % number)
+
+    counters = pps_message.publish_many(pairs(), max_in_flight=4, max_rate=2000,
+                                        progress=progress.append, progress_every=25)
+
+    assert (counters["published"], counters["skipped"]) == (40, 20)
+    assert counters["elapsed"] >= 39 / 2000
+    assert counters["rate"] == pytest.approx(40 / counters["elapsed"])
+    assert len(in_flight) == 40
+    assert max(in_flight) <= 4
+    assert publisher.in_flight() == 0
+    assert [p["published"] for p in progress] == [16, 33, 40]
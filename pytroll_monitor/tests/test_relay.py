@@ -0,0 +1,114 @@
+"""Tests for the relay daemon."""
+import os
+import threading
+import time
+
+import pytest
+import requests_mock
+
+from pytroll_monitor.monitor_hook import OP5Monitor
+from pytroll_monitor.relay import Relay, send_to_relay
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(.001)
+
+
+def test_op5_status_is_relayed(op5_server, tmp_path, monkeypatch):
+    """Test that the hook hands its status to the relay, which sends it."""
+    socket_path = os.fspath(tmp_path / "relay.sock")
+    monkeypatch.setenv("PYTROLL_MONITOR_RELAY", socket_path)
+    relay = Relay(op5={"server": op5_server.url, "auth": ["user", "secret"]})
+    relay.bind()
+    thread = threading.Thread(target=relay.serve)
+    thread.start()
+    try:
+        monitor = OP5Monitor("service", op5_server.url, "host", monitor_auth=["user", "secret"])
+        with pytest.raises(OSError):
+            Relay(socket_path).bind()
+        monitor(1, "first")
+        monitor(0, "second")
+        assert monitor._session is None
+        _wait_for(lambda: len(op5_server.statuses) == 2)
+    finally:
+        relay.stop()
+        thread.join()
+
+    assert [status["plugin_output"] for status in op5_server.statuses] == ["first", "second"]
+    assert op5_server.statuses[0] == {"host_name": "host", "service_description": "service",
+                                      "status_code": 1, "plugin_output": "first"}
+    assert len(op5_server.connections) == 1
+    assert relay.relayed == 2
+    assert not os.path.exists(socket_path)
+
+
+def test_hook_sends_directly_without_relay(tmp_path, monkeypatch):
+    """Test the fallback to sending directly when no relay is listening."""
+    monkeypatch.setenv("PYTROLL_MONITOR_RELAY", os.fspath(tmp_path / "relay.sock"))
+    assert not send_to_relay({"op5": {}})
+
+    server = "http://myop5server.com/some/service"
+    with requests_mock.Mocker() as m:
+        m.post(server, text="OK")
+        OP5Monitor("service", server, "host")(0, "direct")
+        assert m.last_request.json()["plugin_output"] == "direct"
+
+
+def test_relay_is_opt_in(tmp_path, monkeypatch):
+    """Test that the relay is only used when configured, with a socket of the current user."""
+    socket_path = os.fspath(tmp_path / "relay.sock")
+    monkeypatch.delenv("PYTROLL_MONITOR_RELAY", raising=False)
+    with pytest.raises(ValueError):
+        Relay()
+
+    relay = Relay(socket_path)
+    relay.bind()
+    try:
+        assert not send_to_relay({"posttroll": "message"})
+        monkeypatch.setenv("PYTROLL_MONITOR_RELAY", socket_path)
+        assert send_to_relay({"posttroll": "message"})
+        monkeypatch.setattr(os, "getuid", lambda: os.stat(socket_path).st_uid + 1)
+        assert not send_to_relay({"posttroll": "message"})
+        with pytest.raises(ValueError):
+            relay.relay({"op5": {"server": "http://myop5server.com/some/service"}})
+    finally:
+        relay._close()
+
+
+def test_relay_replaces_stale_socket(tmp_path):
+    """Test that the socket of a dead relay is replaced, and other files are left alone."""
+    import socket
+
+    socket_path = os.fspath(tmp_path / "relay.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as dead:
+        dead.bind(socket_path)
+    relay = Relay(socket_path)
+    relay.bind()
+    relay._close()
+
+    not_a_socket = tmp_path / "file"
+    not_a_socket.write_text("keep me")
+    with pytest.raises(FileExistsError):
+        Relay(os.fspath(not_a_socket)).bind()
+    assert not_a_socket.read_text() == "keep me"
+
+
+def test_op5_status_is_sent_directly_unless_relay_sends_to_its_server(op5_server, tmp_path, monkeypatch):
+    """Test that the hook only hands its status to a relay sending to the same server."""
+    socket_path = os.fspath(tmp_path / "relay.sock")
+    monkeypatch.setenv("PYTROLL_MONITOR_RELAY", socket_path)
+    monitor = OP5Monitor("service", op5_server.url, "host")
+    for op5 in [None, {"server": "http://myop5server.com/some/service"}]:
+        relay = Relay(op5=op5)
+        relay.bind()
+        try:
+            monitor(2, "CRITICAL %s" % op5)
+        finally:
+            relay._close()
+    monitor.close()
+
+    assert [status["plugin_output"] for status in op5_server.statuses] == [
+        "CRITICAL None", "CRITICAL {'server': 'http://myop5server.com/some/service'}"]